@@ -1,17 +1,27 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import math
 import re
 import time
 
 from astrbot.api import logger
 from astrbot.core.exceptions import ProviderNotFoundError
+from .llm_cache import (
+    get_session_provider_id,
+    llm_generate_cached,
+    remember_llm_response,
+)
 from .prompts import ALIAS_ANALYSIS_SYSTEM_PROMPT
 from .storage import ImpressionStore
-from .update_service import force_group_update
-from .utils import extract_json
+from .store_executor import to_thread, to_writer
+from .update_service import (
+    claim_scheduled_run,
+    force_group_update,
+    get_update_lock,
+    release_scheduled_run,
+)
+from .utils import format_ts, load_json_payload
 
 MAX_ALIAS_PENDING_MESSAGES = 200
 MAX_ALIAS_RESULTS = 100
@@ -24,137 +34,142 @@ async def maybe_schedule_alias_analysis(
     store: ImpressionStore,
     config,
     debug_log,
-    active_updates: set[str],
     update_locks: dict[str, asyncio.Lock],
     group_id: str,
     umo: str,
 ) -> None:
     key = f"alias:{group_id}"
-    if key in active_updates:
+    # Skip instead of queueing behind another scheduled analysis; a trigger
+    # arriving during a forced one waits on the lock and runs after it.
+    if not claim_scheduled_run(key):
         return
-    active_updates.add(key)
-    lock = update_locks.setdefault(key, asyncio.Lock())
-    async with lock:
-        try:
-            pending = await asyncio.to_thread(
-                store.get_pending_messages_by_group,
-                group_id,
-                MAX_ALIAS_PENDING_MESSAGES,
-            )
-            if not pending:
-                return
-            if len(pending) < config.alias_analysis_batch_size:
-                return
-
+    try:
+        async with get_update_lock(update_locks, key):
             try:
-                provider_id = (
-                    config.alias_provider_id
-                    or await context.get_current_chat_provider_id(umo=umo)
+                pending = await to_thread(
+                    store.get_pending_messages_by_group,
+                    group_id,
+                    MAX_ALIAS_PENDING_MESSAGES,
                 )
-            except ProviderNotFoundError as exc:
-                logger.warning(f"No LLM provider configured: {exc}")
-                return
+                if not pending:
+                    return
+                if len(pending) < config.alias_analysis_batch_size:
+                    return
 
-            prompt = build_alias_prompt(pending)
-            start_ts = time.time()
-            debug_log("[AIC] Alias analysis prompt:\n" + prompt)
-            try:
-                resp = await context.llm_generate(
-                    chat_provider_id=provider_id,
-                    system_prompt=ALIAS_ANALYSIS_SYSTEM_PROMPT,
-                    prompt=prompt,
-                )
-            except ProviderNotFoundError as exc:
-                logger.warning(f"Provider not found for alias analysis: {exc}")
-                return
-            except Exception as exc:  # noqa: BLE001
-                logger.error(f"LLM alias analysis call failed: {exc}")
-                return
+                try:
+                    provider_id = (
+                        config.alias_provider_id
+                        or await get_session_provider_id(context, umo)
+                    )
+                except ProviderNotFoundError as exc:
+                    logger.warning(f"No LLM provider configured: {exc}")
+                    return
 
-            raw_text = resp.completion_text or ""
-            debug_log(f"[AIC] Alias analysis duration: {time.time() - start_ts:.2f}s")
-            debug_log("[AIC] Alias analysis raw response:\n" + raw_text)
-            aliases, ok = parse_alias_json(raw_text)
-            if not ok:
-                logger.warning(
-                    "LLM alias analysis returned invalid JSON, keeping pending messages"
-                )
-                return
-            pending_by_id = {msg.id: msg for msg in pending}
+                prompt = build_alias_prompt(pending)
+                start_ts = time.time()
+                debug_log("[AIC] Alias analysis prompt:\n", prompt)
+                try:
+                    # Alias analysis never dequeues messages, so the same window is
+                    # resent until the group update runs.
+                    raw_text, cache_key = await llm_generate_cached(
+                        context,
+                        debug_log,
+                        provider_id,
+                        ALIAS_ANALYSIS_SYSTEM_PROMPT,
+                        prompt,
+                        label="Alias analysis",
+                    )
+                except ProviderNotFoundError as exc:
+                    logger.warning(f"Provider not found for alias analysis: {exc}")
+                    return
+                except Exception as exc:  # noqa: BLE001
+                    logger.error(f"LLM alias analysis call failed: {exc}")
+                    return
 
-            now = int(time.time())
-            nickname_map = await asyncio.to_thread(
-                store.get_nickname_map,
-                group_id,
-                {item["speaker_id"] for item in aliases}
-                | {item["target_id"] for item in aliases},
-            )
-            pairs: set[tuple[str, str]] = set()
-            for item in aliases[:MAX_ALIAS_RESULTS]:
-                speaker_id = item["speaker_id"]
-                target_id = item["target_id"]
-                evidence_records = _build_alias_evidence_records(
+                debug_log(f"[AIC] Alias analysis duration: {time.time() - start_ts:.2f}s")
+                debug_log("[AIC] Alias analysis raw response:\n", raw_text)
+                aliases, ok = parse_alias_json(raw_text)
+                if not ok:
+                    logger.warning(
+                        "LLM alias analysis returned invalid JSON, keeping pending messages"
+                    )
+                    return
+                remember_llm_response(cache_key, raw_text)
+                pending_by_id = {msg.id: msg for msg in pending}
+
+                now = int(time.time())
+                nickname_map = await to_thread(
+                    store.get_nickname_map,
                     group_id,
-                    target_id,
-                    speaker_id,
-                    item,
-                    pending_by_id,
-                    now,
+                    {item["speaker_id"] for item in aliases}
+                    | {item["target_id"] for item in aliases},
                 )
-                if evidence_records:
-                    await asyncio.to_thread(store.insert_evidence, evidence_records)
-                    await asyncio.to_thread(
-                        store.prune_evidence_by_speaker,
+                pairs: set[tuple[str, str]] = set()
+                for item in aliases[:MAX_ALIAS_RESULTS]:
+                    speaker_id = item["speaker_id"]
+                    target_id = item["target_id"]
+                    evidence_records = _build_alias_evidence_records(
                         group_id,
                         target_id,
-                        "alias",
-                        f"alias:{item['alias']}",
                         speaker_id,
+                        item,
+                        pending_by_id,
+                        now,
+                    )
+                    if evidence_records:
+                        await to_writer(store.insert_evidence, evidence_records)
+                        await to_writer(
+                            store.prune_evidence_by_speaker,
+                            group_id,
+                            target_id,
+                            "alias",
+                            f"alias:{item['alias']}",
+                            speaker_id,
+                            MAX_ALIASES_PER_PAIR,
+                        )
+                    alias_conf = _recompute_alias_confidence(
+                        store,
+                        group_id,
+                        target_id,
+                        speaker_id,
+                        item["alias"],
+                        config.evidence_half_life_days,
+                    )
+                    await to_writer(
+                        store.upsert_alias,
+                        group_id,
+                        speaker_id,
+                        item["alias"],
+                        target_id,
+                        alias_conf,
+                        nickname_map.get(speaker_id),
+                        nickname_map.get(target_id),
+                        "",
+                        now,
+                    )
+                    pairs.add((speaker_id, target_id))
+                for speaker_id, target_id in pairs:
+                    await to_writer(
+                        store.prune_aliases,
+                        group_id,
+                        speaker_id,
+                        target_id,
                         MAX_ALIASES_PER_PAIR,
                     )
-                alias_conf = _recompute_alias_confidence(
+
+                await force_group_update(
+                    context,
                     store,
+                    config,
+                    debug_log,
+                    update_locks,
+                    umo,
                     group_id,
-                    target_id,
-                    speaker_id,
-                    item["alias"],
-                    config.evidence_half_life_days,
                 )
-                await asyncio.to_thread(
-                    store.upsert_alias,
-                    group_id,
-                    speaker_id,
-                    item["alias"],
-                    target_id,
-                    alias_conf,
-                    nickname_map.get(speaker_id),
-                    nickname_map.get(target_id),
-                    "",
-                    now,
-                )
-                pairs.add((speaker_id, target_id))
-            for speaker_id, target_id in pairs:
-                await asyncio.to_thread(
-                    store.prune_aliases,
-                    group_id,
-                    speaker_id,
-                    target_id,
-                    MAX_ALIASES_PER_PAIR,
-                )
-
-            await force_group_update(
-                context,
-                store,
-                config,
-                debug_log,
-                update_locks,
-                umo,
-                group_id,
-            )
-        except Exception as exc:  # noqa: BLE001
-            logger.error(f"Alias analysis failed: {exc}")
-        finally:
-            active_updates.discard(key)
+            except Exception as exc:  # noqa: BLE001
+                logger.error(f"Alias analysis failed: {exc}")
+    finally:
+        release_scheduled_run(key)
 
 
 async def force_alias_analysis(
@@ -167,10 +182,10 @@ async def force_alias_analysis(
     umo: str,
 ) -> bool:
     key = f"alias:{group_id}"
-    lock = update_locks.setdefault(key, asyncio.Lock())
+    lock = get_update_lock(update_locks, key)
     async with lock:
         try:
-            pending = await asyncio.to_thread(
+            pending = await to_thread(
                 store.get_pending_messages_by_group,
                 group_id,
                 MAX_ALIAS_PENDING_MESSAGES,
@@ -181,7 +196,7 @@ async def force_alias_analysis(
             try:
                 provider_id = (
                     config.alias_provider_id
-                    or await context.get_current_chat_provider_id(umo=umo)
+                    or await get_session_provider_id(context, umo)
                 )
             except ProviderNotFoundError as exc:
                 logger.warning(f"No LLM provider configured: {exc}")
@@ -189,12 +204,17 @@ async def force_alias_analysis(
 
             prompt = build_alias_prompt(pending)
             start_ts = time.time()
-            debug_log("[AIC] Alias analysis prompt:\n" + prompt)
+            debug_log("[AIC] Alias analysis prompt:\n", prompt)
             try:
-                resp = await context.llm_generate(
-                    chat_provider_id=provider_id,
-                    system_prompt=ALIAS_ANALYSIS_SYSTEM_PROMPT,
-                    prompt=prompt,
+                # Alias analysis never dequeues messages, so the same window is
+                # resent until the group update runs.
+                raw_text, cache_key = await llm_generate_cached(
+                    context,
+                    debug_log,
+                    provider_id,
+                    ALIAS_ANALYSIS_SYSTEM_PROMPT,
+                    prompt,
+                    label="Alias analysis",
                 )
             except ProviderNotFoundError as exc:
                 logger.warning(f"Provider not found for alias analysis: {exc}")
@@ -203,19 +223,19 @@ async def force_alias_analysis(
                 logger.error(f"LLM alias analysis call failed: {exc}")
                 return False
 
-            raw_text = resp.completion_text or ""
             debug_log(f"[AIC] Alias analysis duration: {time.time() - start_ts:.2f}s")
-            debug_log("[AIC] Alias analysis raw response:\n" + raw_text)
+            debug_log("[AIC] Alias analysis raw response:\n", raw_text)
             aliases, ok = parse_alias_json(raw_text)
             if not ok:
                 logger.warning(
                     "LLM alias analysis returned invalid JSON, keeping pending messages"
                 )
                 return False
+            remember_llm_response(cache_key, raw_text)
             pending_by_id = {msg.id: msg for msg in pending}
 
             now = int(time.time())
-            nickname_map = await asyncio.to_thread(
+            nickname_map = await to_thread(
                 store.get_nickname_map,
                 group_id,
                 {item["speaker_id"] for item in aliases}
@@ -234,8 +254,8 @@ async def force_alias_analysis(
                     now,
                 )
                 if evidence_records:
-                    await asyncio.to_thread(store.insert_evidence, evidence_records)
-                    await asyncio.to_thread(
+                    await to_writer(store.insert_evidence, evidence_records)
+                    await to_writer(
                         store.prune_evidence_by_speaker,
                         group_id,
                         target_id,
@@ -252,7 +272,7 @@ async def force_alias_analysis(
                     item["alias"],
                     config.evidence_half_life_days,
                 )
-                await asyncio.to_thread(
+                await to_writer(
                     store.upsert_alias,
                     group_id,
                     speaker_id,
@@ -266,7 +286,7 @@ async def force_alias_analysis(
                 )
                 pairs.add((speaker_id, target_id))
             for speaker_id, target_id in pairs:
-                await asyncio.to_thread(
+                await to_writer(
                     store.prune_aliases,
                     group_id,
                     speaker_id,
@@ -290,24 +310,21 @@ async def force_alias_analysis(
 
 
 def build_alias_prompt(pending) -> str:
-    lines = [
-        "Messages:",
-    ]
-    for idx, msg in enumerate(pending, 1):
-        ts_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(msg.ts))
-        lines.append(
-            f"{msg.id}. [{ts_text}] speaker={msg.user_id} text={msg.message}"
-        )
-    return "\n".join(lines)
+    # format_ts is lru_cached, so messages sharing a second format once.
+    return "\n".join(
+        [
+            "Messages:",
+            *(
+                f"{msg.id}. [{format_ts(msg.ts)}] speaker={msg.user_id} text={msg.message}"
+                for msg in pending
+            ),
+        ]
+    )
 
 
 def parse_alias_json(text: str) -> tuple[list[dict], bool]:
-    raw = extract_json(text or "")
-    if not raw:
-        return [], False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text or "")
+    if data is None:
         return [], False
     items = data.get("aliases", [])
     if not isinstance(items, list):
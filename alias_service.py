@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import re
 import time
 
@@ -10,7 +9,8 @@ from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
 )
 
 from .storage import ImpressionStore
-from .utils import last_token, token_count
+from .store_executor import to_thread, to_writer
+from .utils import last_of_tokens, tokenize
 
 _ALIAS_MIN_LEN = 2
 _ALIAS_MAX_LEN = 8
@@ -24,7 +24,13 @@ def _strip_trailing_punct(text: str) -> str:
     return _ALIAS_PUNCT_RE.sub("", text.strip())
 
 
-def _is_plausible_alias(alias: str, buffer_text: str, *, strict: bool) -> bool:
+def normalize_alias(text: str) -> str:
+    return _strip_trailing_punct(text).lower()
+
+
+def _is_plausible_alias(
+    alias: str, buffer_text: str, token_total: int, *, strict: bool
+) -> bool:
     alias = alias.strip()
     if not alias:
         return False
@@ -37,7 +43,7 @@ def _is_plausible_alias(alias: str, buffer_text: str, *, strict: bool) -> bool:
         return False
     if len(buffer_text) > _ALIAS_MAX_BUFFER_LEN:
         return False
-    if token_count(buffer_text) > _ALIAS_MAX_TOKENS:
+    if token_total > _ALIAS_MAX_TOKENS:
         return False
 
     buffer_core = _strip_trailing_punct(buffer_text)
@@ -57,13 +63,13 @@ async def learn_aliases(
         return
     evidence_text = event.get_message_str() or ""
     now = int(time.time())
-    nickname_map = await asyncio.to_thread(
+    nickname_map = await to_thread(
         store.get_nickname_map,
         group_id,
         {speaker_id, *[target_id for _, target_id, _ in candidates]},
     )
     for alias, target_id, confidence in candidates:
-        await asyncio.to_thread(
+        await to_writer(
             store.upsert_alias,
             group_id,
             speaker_id,
@@ -80,7 +86,7 @@ async def learn_aliases(
 async def resolve_alias(
     store: ImpressionStore, group_id: str, speaker_id: str, alias: str
 ) -> str | None:
-    candidates = await asyncio.to_thread(
+    candidates = await to_thread(
         store.find_alias_targets, group_id, speaker_id, alias
     )
     if not candidates:
@@ -113,8 +119,10 @@ def extract_alias_candidates(event: AiocqhttpMessageEvent):
         if isinstance(comp, Plain):
             buffer += comp.text
         elif isinstance(comp, At):
-            alias = last_token(buffer)
-            if alias and _is_plausible_alias(alias, buffer, strict=False):
+            # Tokenized once for both the alias pick and the token limit.
+            tokens = tokenize(buffer)
+            alias = last_of_tokens(tokens)
+            if alias and _is_plausible_alias(alias, buffer, len(tokens), strict=False):
                 candidates.append((alias, str(comp.qq), 0.9))
             buffer = ""
         elif isinstance(comp, Reply):
@@ -123,8 +131,9 @@ def extract_alias_candidates(event: AiocqhttpMessageEvent):
     if not candidates:
         reply_target = extract_reply_target_id(event)
         if reply_target:
-            alias = last_token(buffer)
-            if alias and _is_plausible_alias(alias, buffer, strict=True):
+            tokens = tokenize(buffer)
+            alias = last_of_tokens(tokens)
+            if alias and _is_plausible_alias(alias, buffer, len(tokens), strict=True):
                 candidates.append((alias, reply_target, 0.7))
 
     return candidates
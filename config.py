@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Iterable
 
 from astrbot.core.config.astrbot_config import AstrBotConfig
@@ -17,6 +17,10 @@ class PluginConfig:
     group_batch_attribution_max_messages: int
     group_batch_attribution_max_targets_per_message: int
     group_batch_attribution_include_summary: bool
+    group_batch_attribution_skip_ratio: float
+    group_batch_max_message_chars: int
+    group_batch_max_prompt_chars: int
+    store_pool_size: int
     evidence_half_life_days: float
     impression_confidence_min: float
     bot_user_id: str
@@ -34,6 +38,10 @@ class PluginConfig:
     ignore_regex: str
     force_tool_guidance: bool
     debug_mode: bool
+    bot_alias_set: frozenset[str] = field(init=False, default=frozenset())
+
+    def __post_init__(self) -> None:
+        self.bot_alias_set = frozenset(self.bot_aliases)
 
     @classmethod
     def from_config(cls, config: AstrBotConfig | dict | None) -> "PluginConfig":
@@ -69,6 +77,16 @@ class PluginConfig:
             group_batch_attribution_include_summary=bool(
                 update.get("group_batch_attribution_include_summary", True)
             ),
+            group_batch_attribution_skip_ratio=float(
+                update.get("group_batch_attribution_skip_ratio", 0.0)
+            ),
+            group_batch_max_message_chars=int(
+                update.get("group_batch_max_message_chars", 500)
+            ),
+            group_batch_max_prompt_chars=int(
+                update.get("group_batch_max_prompt_chars", 0)
+            ),
+            store_pool_size=int(update.get("store_pool_size", 4)),
             evidence_half_life_days=float(update.get("evidence_half_life_days", 30.0)),
             impression_confidence_min=float(
                 update.get("impression_confidence_min", update.get("fact_confidence_min", 0.1))
@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import asyncio
-
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
@@ -10,6 +8,7 @@ from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
 
 from .alias_service import extract_target_id_from_mentions
 from .storage import ImpressionStore
+from .store_executor import to_thread
 from .utils import is_impression_query
 
 
@@ -70,7 +69,7 @@ async def apply_injection(
     injections: list[str] = []
 
     if not needs_tool:
-        profile = await asyncio.to_thread(store.get_profile, user_id)
+        profile = await to_thread(store.get_profile, user_id)
         if profile and profile.summary:
             injection = format_profile_for_injection(profile, config.inject_max_chars)
             if injection:
@@ -83,7 +82,7 @@ async def apply_injection(
         if isinstance(event, AiocqhttpMessageEvent):
             target_id = extract_target_id_from_mentions(event)
             if target_id and str(target_id) != user_id:
-                target_profile = await asyncio.to_thread(
+                target_profile = await to_thread(
                     store.get_profile, str(target_id)
                 )
                 if target_profile and target_profile.summary:
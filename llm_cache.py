@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from astrbot.core.exceptions import ProviderNotFoundError
+
+LLM_CACHE_MAX_ENTRIES = 64
+LLM_CACHE_TTL_SEC = 1800
+SESSION_PROVIDER_TTL_SEC = 60.0
+# umo -> (provider id, resolved at). Saves the session provider lookup on every
+# update in the default config; entries are dropped when the provider is gone.
+_SESSION_PROVIDER_IDS: dict[str, tuple[str, float]] = {}
+
+
+@lru_cache(maxsize=32)
+def _prefix_digest(provider_id: str, system_prompt: str):
+    # System prompts are module constants and providers are few, so the hash
+    # state after the fixed prefix is computed once and copied per call.
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (provider_id, system_prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest
+
+
+class LLMCache:
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_sec: float = LLM_CACHE_TTL_SEC,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[bytes, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def make_key(provider_id: str, system_prompt: str, prompt: str) -> bytes:
+        digest = _prefix_digest(provider_id, system_prompt).copy()
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\x00")
+        return digest.digest()
+
+    def get(self, key: bytes) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, key: bytes, text: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_sec, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Process-wide: update phases and alias analysis share one response cache.
+_LLM_CACHE = LLMCache()
+
+
+async def get_session_provider_id(context, umo: str) -> str:
+    now = time.monotonic()
+    entry = _SESSION_PROVIDER_IDS.get(umo)
+    if entry is not None and now - entry[1] < SESSION_PROVIDER_TTL_SEC:
+        return entry[0]
+    provider_id = await context.get_current_chat_provider_id(umo=umo)
+    if provider_id:
+        _SESSION_PROVIDER_IDS[umo] = (provider_id, now)
+    return provider_id
+
+
+def forget_session_provider_id(provider_id: str) -> None:
+    stale = [
+        umo
+        for umo, (cached_id, _) in _SESSION_PROVIDER_IDS.items()
+        if cached_id == provider_id
+    ]
+    for umo in stale:
+        del _SESSION_PROVIDER_IDS[umo]
+
+
+async def llm_generate_cached(
+    context,
+    debug_log,
+    provider_id: str,
+    system_prompt: str,
+    prompt: str,
+    *,
+    label: str = "LLM response",
+) -> tuple[str, bytes]:
+    # Callers only remember responses that parsed, so a malformed reply is
+    # retried.
+    cache_key = LLMCache.make_key(provider_id, system_prompt, prompt)
+    cached = _LLM_CACHE.get(cache_key)
+    if cached is not None:
+        debug_log(f"[AIC] {label} cache hit")
+        return cached, cache_key
+    try:
+        resp = await context.llm_generate(
+            chat_provider_id=provider_id,
+            system_prompt=system_prompt,
+            prompt=prompt,
+        )
+    except ProviderNotFoundError:
+        forget_session_provider_id(provider_id)
+        raise
+    return resp.completion_text or "", cache_key
+
+
+def remember_llm_response(cache_key: bytes, raw_text: str) -> None:
+    _LLM_CACHE.put(cache_key, raw_text)
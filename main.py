@@ -18,12 +18,28 @@ from astrbot.core.star.star_handler import EventType, star_handlers_registry
 from astrbot.core.utils.path_utils import get_astrbot_plugin_data_path
 
 from .alias_analysis_service import force_alias_analysis, maybe_schedule_alias_analysis
-from .alias_service import extract_target_id_from_mentions, resolve_alias
+from .alias_service import (
+    extract_target_id_from_mentions,
+    normalize_alias,
+    resolve_alias,
+)
 from .config import PluginConfig
 from .injection import apply_injection, format_profile_for_injection
 from .storage import ImpressionStore, ProfileRecord
-from .update_service import force_group_update, maybe_schedule_group_update
+from .store_executor import (
+    configure_store_executor,
+    shutdown_store_executor,
+    to_thread,
+    to_writer,
+)
+from .update_service import (
+    force_group_update,
+    maybe_schedule_group_update,
+    note_message_enqueued,
+)
 from .utils import (
+    alias_tokens,
+    collapse_whitespace,
     extract_raw_text,
     extract_plain_text,
     is_self_profile_query,
@@ -31,6 +47,9 @@ from .utils import (
 
 PLUGIN_NAME = "astrbot_plugin_auto_impression_card"
 
+_UPDATE_TARGET_RE = re.compile(r"对(?P<name>[^\s@]{1,12})的?印象")
+
+
 @register(
     PLUGIN_NAME,
     "ninifox",
@@ -51,17 +70,15 @@ class AutoImpressionCard(Star):
         db_path = data_dir / "impressions.db"
         self.store = ImpressionStore(db_path)
         self.store.initialize()
-        self._active_updates: set[str] = set()
-        self._update_locks: dict[str, asyncio.Lock] = {}
-        self._alias_active_updates: set[str] = set()
         self._alias_update_locks: dict[str, asyncio.Lock] = {}
-        self._group_active_updates: set[str] = set()
         self._group_update_locks: dict[str, asyncio.Lock] = {}
 
     async def initialize(self):
+        configure_store_executor(self.config.store_pool_size)
         logger.info("Auto Impression Card plugin initialized")
 
     async def terminate(self):
+        shutdown_store_executor()
         logger.info("Auto Impression Card plugin terminated")
 
     @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
@@ -93,15 +110,16 @@ class AutoImpressionCard(Star):
         user_id = str(event.get_sender_id())
         nickname = event.get_sender_name() or user_id
 
-        await asyncio.to_thread(
+        await to_writer(
             self.store.touch_profile, group_id, user_id, nickname, ts
         )
         if plain_text and self._is_command_message(event, plain_text):
             return
         raw_text = raw_text or plain_text
-        await asyncio.to_thread(
+        await to_writer(
             self.store.enqueue_message, group_id, user_id, raw_text, ts
         )
+        note_message_enqueued(group_id)
         asyncio.create_task(
             self._run_group_update_with_alias(
                 group_id,
@@ -157,7 +175,7 @@ class AutoImpressionCard(Star):
         elif target.isdigit():
             target_id = target
         else:
-            candidates = await asyncio.to_thread(
+            candidates = await to_thread(
                 self.store.find_alias_targets, group_id, speaker_id, target
             )
             if len(candidates) == 1:
@@ -167,7 +185,7 @@ class AutoImpressionCard(Star):
                 return self._tool_result("ambiguous", "alias matched multiple users", ids)
             else:
                 # fallback: try global alias then nickname match
-                candidates = await asyncio.to_thread(
+                candidates = await to_thread(
                     self.store.find_alias_targets_global, group_id, target
                 )
                 if len(candidates) == 1:
@@ -179,7 +197,7 @@ class AutoImpressionCard(Star):
                     )
 
                 if not target_id:
-                    profiles = await asyncio.to_thread(
+                    profiles = await to_thread(
                         self.store.find_profiles_by_nickname, target
                     )
                     if len(profiles) == 1:
@@ -193,29 +211,24 @@ class AutoImpressionCard(Star):
                         pass
 
         if not target_id and message_text:
-            alias_index = await asyncio.to_thread(self.store.get_alias_index, group_id)
-            token_candidates = [
-                t for t in re.findall(r"[\w\u4e00-\u9fff]{2,16}", message_text)
-            ]
-
-            def _norm_alias(text: str) -> str:
-                return re.sub(r"[，。！？,!.?;；:：]+$", "", text.strip()).lower()
+            alias_index = await to_thread(self.store.get_alias_index, group_id)
+            token_candidates = alias_tokens(message_text)
 
             speaker_lookup: dict[str, str] = {}
             for alias in alias_index.get(speaker_id, {}).keys():
-                norm = _norm_alias(alias)
+                norm = normalize_alias(alias)
                 if norm and norm not in speaker_lookup:
                     speaker_lookup[norm] = alias
 
             global_lookup: dict[str, str] = {}
             for aliases in alias_index.values():
                 for alias in aliases.keys():
-                    norm = _norm_alias(alias)
+                    norm = normalize_alias(alias)
                     if norm and norm not in global_lookup:
                         global_lookup[norm] = alias
 
             for token in token_candidates:
-                norm = _norm_alias(token)
+                norm = normalize_alias(token)
                 if not norm:
                     continue
                 matched_alias = speaker_lookup.get(norm)
@@ -223,7 +236,7 @@ class AutoImpressionCard(Star):
                     matched_alias = global_lookup[norm]
                 if not matched_alias:
                     continue
-                candidates = await asyncio.to_thread(
+                candidates = await to_thread(
                     self.store.find_alias_targets, group_id, speaker_id, matched_alias
                 )
                 if len(candidates) == 1:
@@ -234,7 +247,7 @@ class AutoImpressionCard(Star):
                     return self._tool_result(
                         "ambiguous", "alias matched multiple users", ids
                     )
-                candidates = await asyncio.to_thread(
+                candidates = await to_thread(
                     self.store.find_alias_targets_global, group_id, matched_alias
                 )
                 if len(candidates) == 1:
@@ -255,11 +268,11 @@ class AutoImpressionCard(Star):
                 "current speaker not allowed unless explicitly requested",
             )
 
-        profile = await asyncio.to_thread(self.store.get_profile, target_id)
+        profile = await to_thread(self.store.get_profile, target_id)
         if not profile or not profile.summary:
             return self._tool_result("not_found", "no profile for user")
 
-        alias_rows = await asyncio.to_thread(
+        alias_rows = await to_thread(
             self.store.get_aliases_by_target, group_id, target_id
         )
         aliases_by_speaker: dict[str, list[str]] = {}
@@ -319,7 +332,7 @@ class AutoImpressionCard(Star):
         if not alias:
             return self._tool_result("not_found", "empty alias")
 
-        candidates = await asyncio.to_thread(
+        candidates = await to_thread(
             self.store.find_alias_targets, group_id, speaker_id, alias
         )
         if len(candidates) == 1:
@@ -329,7 +342,7 @@ class AutoImpressionCard(Star):
             ids = ", ".join(c["target_id"] for c in candidates[:5])
             return self._tool_result("ambiguous", "alias matched multiple users", ids)
 
-        candidates = await asyncio.to_thread(
+        candidates = await to_thread(
             self.store.find_alias_targets_global, group_id, alias
         )
         if len(candidates) == 1:
@@ -339,7 +352,7 @@ class AutoImpressionCard(Star):
             ids = ", ".join(c["target_id"] for c in candidates[:5])
             return self._tool_result("ambiguous", "alias matched multiple users", ids)
 
-        profiles = await asyncio.to_thread(
+        profiles = await to_thread(
             self.store.find_profiles_by_nickname, alias
         )
         if len(profiles) == 1:
@@ -374,7 +387,7 @@ class AutoImpressionCard(Star):
             yield event.plain_result("请 @群友 或提供昵称")
             return
 
-        profile = await asyncio.to_thread(self.store.get_profile, target_id)
+        profile = await to_thread(self.store.get_profile, target_id)
         if not profile or not profile.summary:
             yield event.plain_result("暂无该成员档案")
             return
@@ -410,7 +423,7 @@ class AutoImpressionCard(Star):
 
         yield event.plain_result("正在强制更新印象档案...")
         if global_update:
-            group_ids = await asyncio.to_thread(self.store.get_group_ids)
+            group_ids = await to_thread(self.store.get_group_ids)
             ok = False
             for gid in group_ids:
                 await force_alias_analysis(
@@ -532,7 +545,7 @@ class AutoImpressionCard(Star):
     @staticmethod
     def _extract_target_from_update_phrase(message_str: str) -> str:
         text = message_str.strip()
-        match = re.search(r"对(?P<name>[^\s@]{1,12})的?印象", text)
+        match = _UPDATE_TARGET_RE.search(text)
         if match:
             return match.group("name").strip()
         return ""
@@ -552,7 +565,7 @@ class AutoImpressionCard(Star):
     def _is_command_message(
         self, event: AstrMessageEvent, plain_text: str
     ) -> bool:
-        message = re.sub(r"\s+", " ", plain_text.strip())
+        message = collapse_whitespace(plain_text)
         if not message:
             return False
 
@@ -588,9 +601,11 @@ class AutoImpressionCard(Star):
             lines.append("Impressions: " + "; ".join(impressions))
         return "\n".join(lines)
 
-    def _debug_log(self, message: str) -> None:
+    def _debug_log(self, *parts: str) -> None:
+        # Parts are joined only when debug mode is on, so passing a large prompt
+        # as a separate argument costs nothing in production.
         if self.config.debug_mode:
-            logger.info(message)
+            logger.info("".join(parts))
 
     @staticmethod
     def _has_global_update_flag(tokens: list[str]) -> bool:
@@ -607,7 +622,6 @@ class AutoImpressionCard(Star):
             self.store,
             self.config,
             self._debug_log,
-            self._alias_active_updates,
             self._alias_update_locks,
             group_id,
             umo,
@@ -617,7 +631,6 @@ class AutoImpressionCard(Star):
             self.store,
             self.config,
             self._debug_log,
-            self._group_active_updates,
             self._group_update_locks,
             group_id,
             umo,
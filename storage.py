@@ -2,10 +2,50 @@ from __future__ import annotations
 
 import json
 import sqlite3
+import threading
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, NamedTuple
+
+from .utils import dumps_json, loads_json
+
+SQL_MAX_IN_PARAMS = 500
+
+_UPSERT_PROFILE_SQL = """
+    INSERT INTO profiles (
+        user_id, nickname, last_seen, summary,
+        impressions, impressions_confidence, updated_at, version
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        nickname=excluded.nickname,
+        last_seen=excluded.last_seen,
+        summary=excluded.summary,
+        impressions=excluded.impressions,
+        impressions_confidence=excluded.impressions_confidence,
+        updated_at=excluded.updated_at,
+        version=excluded.version
+"""
+
+_INSERT_EVIDENCE_SQL = """
+    INSERT INTO impression_evidence (
+        group_id,
+        user_id,
+        item_type,
+        item_text,
+        message_id,
+        speaker_id,
+        message_text,
+        message_ts,
+        evidence_confidence,
+        joke_likelihood,
+        source_type,
+        consistency_tag,
+        created_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 
 @dataclass(slots=True)
@@ -36,9 +76,20 @@ class GroupMessage:
     ts: int
 
 
+class EvidenceRow(NamedTuple):
+    evidence_confidence: float
+    joke_likelihood: float
+    source_type: str
+    speaker_id: str
+    consistency_tag: str | None
+    message_ts: int
+
+
 class ImpressionStore:
     def __init__(self, db_path: Path) -> None:
         self.db_path = db_path
+        self.supports_math_functions = False
+        self._local = threading.local()
 
     def initialize(self) -> None:
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -151,6 +202,7 @@ class ImpressionStore:
                     self._ensure_profile_columns(cur)
                     self._ensure_evidence_columns(cur)
                     conn.commit()
+                    self.supports_math_functions = self._probe_math_functions(cur)
                 break
             except sqlite3.OperationalError as exc:
                 if "locked" not in str(exc).lower() or idx == attempts - 1:
@@ -158,13 +210,27 @@ class ImpressionStore:
                 time.sleep(0.2 * (idx + 1))
 
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("PRAGMA temp_store=MEMORY")
-        conn.row_factory = sqlite3.Row
+        # One connection per worker thread, reused across calls. Every caller
+        # uses it as a context manager, so each call still ends in its own
+        # commit or rollback.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
         return conn
 
+    @staticmethod
+    def _probe_math_functions(cur: sqlite3.Cursor) -> bool:
+        try:
+            cur.execute("SELECT exp(0), ln(1)")
+        except sqlite3.OperationalError:
+            return False
+        return True
+
     @staticmethod
     def _ensure_alias_map_columns(cur: sqlite3.Cursor) -> None:
         cols = {row[1] for row in cur.execute("PRAGMA table_info(alias_map)")}
@@ -445,6 +511,18 @@ class ImpressionStore:
             ).fetchone()
             return int(row["cnt"]) if row else 0
 
+    def get_group_pending_state(self, group_id: str) -> tuple[int, int]:
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM message_queue WHERE group_id=?) AS cnt,
+                    (SELECT last_update FROM group_state WHERE group_id=?) AS last_update
+                """,
+                (group_id, group_id),
+            ).fetchone()
+            return int(row["cnt"] or 0), int(row["last_update"] or 0)
+
     def get_pending_messages(
         self, group_id: str, user_id: str, limit: int | None = None
     ) -> list[PendingMessage]:
@@ -462,16 +540,6 @@ class ImpressionStore:
             rows = conn.execute(sql, params).fetchall()
             return [PendingMessage(id=row["id"], message=row["message"], ts=row["ts"]) for row in rows]
 
-    def delete_pending_messages(self, ids: Iterable[int]) -> None:
-        ids = list(ids)
-        if not ids:
-            return
-        placeholders = ",".join(["?"] * len(ids))
-        sql = f"DELETE FROM message_queue WHERE id IN ({placeholders})"
-        with self._connect() as conn:
-            conn.execute(sql, ids)
-            conn.commit()
-
     def get_pending_messages_by_group(
         self, group_id: str, limit: int | None = None
     ) -> list[GroupMessage]:
@@ -508,16 +576,24 @@ class ImpressionStore:
             ).fetchone()
             if not row:
                 return None
-            return ProfileRecord(
-                user_id=row["user_id"],
-                nickname=row["nickname"],
-                last_seen=row["last_seen"],
-                summary=row["summary"],
-                impressions=self._load_list(row["impressions"]),
-                impressions_confidence=self._load_dict(row["impressions_confidence"]),
-                updated_at=row["updated_at"],
-                version=row["version"] or 1,
-            )
+            return self._profile_from_row(row)
+
+    def get_profiles(self, user_ids: Iterable[str]) -> dict[str, ProfileRecord]:
+        ids = list(dict.fromkeys(str(uid) for uid in user_ids))
+        results: dict[str, ProfileRecord] = {}
+        if not ids:
+            return results
+        with self._connect() as conn:
+            for start in range(0, len(ids), SQL_MAX_IN_PARAMS):
+                chunk = ids[start : start + SQL_MAX_IN_PARAMS]
+                placeholders = ",".join(["?"] * len(chunk))
+                rows = conn.execute(
+                    f"SELECT * FROM profiles WHERE user_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    results[row["user_id"]] = self._profile_from_row(row)
+        return results
 
     def get_group_ids(self) -> list[str]:
         with self._connect() as conn:
@@ -547,12 +623,13 @@ class ImpressionStore:
         with self._connect() as conn:
             rows = conn.execute(sql, params).fetchall()
             user_ids = [str(row["user_id"]) for row in rows if row["user_id"]]
+            profiles = self.get_profiles(user_ids)
             results: list[ProfileRecord] = []
             for row in rows:
                 user_id = str(row["user_id"])
                 if not user_id:
                     continue
-                profile = self.get_profile(user_id)
+                profile = profiles.get(user_id)
                 if profile:
                     results.append(profile)
                 else:
@@ -578,21 +655,7 @@ class ImpressionStore:
                 """,
                 (nickname,),
             ).fetchall()
-            results = []
-            for row in rows:
-                results.append(
-                    ProfileRecord(
-                        user_id=row["user_id"],
-                        nickname=row["nickname"],
-                        last_seen=row["last_seen"],
-                        summary=row["summary"],
-                        impressions=self._load_list(row["impressions"]),
-                        impressions_confidence=self._load_dict(row["impressions_confidence"]),
-                        updated_at=row["updated_at"],
-                        version=row["version"] or 1,
-                    )
-                )
-            return results
+            return [self._profile_from_row(row) for row in rows]
 
     def upsert_profile(
         self,
@@ -600,111 +663,164 @@ class ImpressionStore:
     ) -> None:
         with self._connect() as conn:
             conn.execute(
-                """
-                INSERT INTO profiles (
-                    user_id, nickname, last_seen, summary,
-                    impressions, impressions_confidence, updated_at, version
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    nickname=excluded.nickname,
-                    last_seen=excluded.last_seen,
-                    summary=excluded.summary,
-                    impressions=excluded.impressions,
-                    impressions_confidence=excluded.impressions_confidence,
-                    updated_at=excluded.updated_at,
-                    version=excluded.version
-                """,
-                (
-                    record.user_id,
-                    record.nickname,
-                    record.last_seen,
-                    record.summary,
-                    json.dumps(record.impressions, ensure_ascii=False),
-                    json.dumps(record.impressions_confidence, ensure_ascii=False),
-                    record.updated_at,
-                    record.version,
-                ),
+                _UPSERT_PROFILE_SQL, self._profile_params(record, record.impressions_confidence)
             )
             conn.commit()
 
-    def upsert_profile_with_confidence(
+    def insert_evidence(self, records: list[tuple]) -> None:
+        if not records:
+            return
+        with self._connect() as conn:
+            conn.executemany(_INSERT_EVIDENCE_SQL, records)
+            conn.commit()
+
+    def bulk_insert_evidence(
         self,
-        record: ProfileRecord,
-        impressions_confidence: dict[str, float],
+        records: list[tuple],
+        prune_keys: list[tuple[str, str, str]],
+        max_items: int,
     ) -> None:
+        if not records:
+            return
         with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO profiles (
-                    user_id, nickname, last_seen, summary,
-                    impressions, impressions_confidence, updated_at, version
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(_INSERT_EVIDENCE_SQL, records)
+            if prune_keys and max_items > 0:
+                conn.executemany(
+                    """
+                    DELETE FROM impression_evidence
+                    WHERE id IN (
+                        SELECT id FROM impression_evidence
+                        WHERE user_id=? AND item_type=? AND item_text=?
+                        ORDER BY message_ts DESC, id DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    [(*key, max_items) for key in prune_keys],
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    nickname=excluded.nickname,
-                    last_seen=excluded.last_seen,
-                    summary=excluded.summary,
-                    impressions=excluded.impressions,
-                    impressions_confidence=excluded.impressions_confidence,
-                    updated_at=excluded.updated_at,
-                    version=excluded.version
-                """,
-                (
-                    record.user_id,
-                    record.nickname,
-                    record.last_seen,
-                    record.summary,
-                    json.dumps(record.impressions, ensure_ascii=False),
-                    json.dumps(impressions_confidence, ensure_ascii=False),
-                    record.updated_at,
-                    record.version,
-                ),
-            )
             conn.commit()
 
-    def insert_evidence(self, records: list[tuple]) -> None:
-        if not records:
-            return
+    def commit_group_update(
+        self,
+        group_id: str,
+        ts: int,
+        message_ids: Iterable[int],
+        delete_keys: list[tuple[str, str, str]],
+        records: list[ProfileRecord],
+    ) -> None:
+        # Profiles, dropped evidence and queue cleanup land in one transaction,
+        # so a failure cannot leave written profiles with requeued messages.
         with self._connect() as conn:
-            conn.executemany(
-                """
-                INSERT INTO impression_evidence (
-                    group_id,
-                    user_id,
-                    item_type,
-                    item_text,
-                    message_id,
-                    speaker_id,
-                    message_text,
-                    message_ts,
-                    evidence_confidence,
-                    joke_likelihood,
-                    source_type,
-                    consistency_tag,
-                    created_at
+            conn.execute("BEGIN IMMEDIATE")
+            if delete_keys:
+                conn.executemany(
+                    """
+                    DELETE FROM impression_evidence
+                    WHERE user_id=? AND item_type=? AND item_text=?
+                    """,
+                    delete_keys,
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                records,
-            )
+            if records:
+                conn.executemany(
+                    _UPSERT_PROFILE_SQL,
+                    [
+                        self._profile_params(record, record.impressions_confidence)
+                        for record in records
+                    ],
+                )
+            self._finish_group_update(conn, group_id, ts, message_ids)
             conn.commit()
 
-    def get_evidence_for_item(
-        self, group_id: str, user_id: str, item_type: str, item_text: str
-    ) -> list[dict]:
+    def get_evidence_for_items(
+        self,
+        group_id: str,
+        user_id: str,
+        item_type: str,
+        item_texts: Iterable[str],
+    ) -> dict[str, list[EvidenceRow]]:
+        texts = list(dict.fromkeys(item_texts))
+        results: dict[str, list[EvidenceRow]] = {text: [] for text in texts}
+        if not texts:
+            return results
         with self._connect() as conn:
-            rows = conn.execute(
-                """
-                SELECT message_id, speaker_id, message_ts, evidence_confidence,
-                       joke_likelihood, source_type, consistency_tag
-                FROM impression_evidence
-                WHERE user_id=? AND item_type=? AND item_text=?
-                ORDER BY message_ts DESC, id DESC
-                """,
-                (user_id, item_type, item_text),
-            ).fetchall()
-            return [dict(row) for row in rows]
+            cur = conn.cursor()
+            cur.row_factory = None
+            for start in range(0, len(texts), SQL_MAX_IN_PARAMS):
+                chunk = texts[start : start + SQL_MAX_IN_PARAMS]
+                placeholders = ",".join(["?"] * len(chunk))
+                rows = cur.execute(
+                    f"""
+                    SELECT item_text,
+                           COALESCE(NULLIF(evidence_confidence, 0), 0.6),
+                           COALESCE(NULLIF(joke_likelihood, 0), 0.2),
+                           COALESCE(NULLIF(source_type, ''), 'other'),
+                           COALESCE(speaker_id, ''),
+                           consistency_tag,
+                           message_ts
+                    FROM impression_evidence
+                    WHERE user_id=? AND item_type=? AND item_text IN ({placeholders})
+                    ORDER BY message_ts DESC, id DESC
+                    """,
+                    (user_id, item_type, *chunk),
+                ).fetchall()
+                for row in rows:
+                    results[row[0]].append(EvidenceRow._make(row[1:]))
+        return results
+
+    def get_confidence_scores(
+        self,
+        group_id: str,
+        user_id: str,
+        item_type: str,
+        item_texts: Iterable[str],
+        now: int,
+        half_life_sec: float,
+    ) -> dict[str, float]:
+        texts = list(dict.fromkeys(item_texts))
+        if not texts:
+            return {}
+        decay_params: tuple = ()
+        decay_sql = "1.0"
+        if half_life_sec > 0:
+            decay_sql = "EXP(-MAX(0.0, ? - e.message_ts) / ?)"
+            decay_params = (now, half_life_sec)
+        results: dict[str, float] = {}
+        with self._connect() as conn:
+            for start in range(0, len(texts), SQL_MAX_IN_PARAMS):
+                chunk = texts[start : start + SQL_MAX_IN_PARAMS]
+                placeholders = ",".join(["?"] * len(chunk))
+                rows = conn.execute(
+                    f"""
+                    SELECT item_text,
+                           CASE WHEN MAX(signal) >= 1.0 THEN 1.0
+                                ELSE 1.0 - EXP(SUM(LN(1.0 - signal)))
+                           END AS score
+                    FROM (
+                        SELECT e.item_text AS item_text,
+                               MIN(1.0, MAX(0.0,
+                                   COALESCE(NULLIF(e.evidence_confidence, 0), 0.6)
+                                   * (1 - COALESCE(NULLIF(e.joke_likelihood, 0), 0.2))
+                                   * CASE e.source_type WHEN 'self' THEN 1.0 ELSE 0.7 END
+                                   * COALESCE(t.trust, 0.7)
+                                   * CASE e.consistency_tag
+                                         WHEN 'conflicting' THEN 0.4
+                                         WHEN 'neutral' THEN 0.7
+                                         ELSE 1.0
+                                     END
+                                   * {decay_sql}
+                               )) AS signal
+                        FROM impression_evidence e
+                        LEFT JOIN user_trust t
+                            ON t.group_id=? AND t.user_id=e.speaker_id
+                        WHERE e.user_id=? AND e.item_type=? AND e.item_text IN ({placeholders})
+                    )
+                    GROUP BY item_text
+                    """,
+                    (*decay_params, group_id, user_id, item_type, *chunk),
+                ).fetchall()
+                for row in rows:
+                    results[row["item_text"]] = float(row["score"])
+        return results
 
     def get_evidence_for_item_and_speaker(
         self,
@@ -780,6 +896,32 @@ class ImpressionStore:
                 return default_trust
             return float(row["trust"])
 
+    def get_user_trusts(
+        self, group_id: str, user_ids: Iterable[str]
+    ) -> dict[str, float]:
+        ids = list(dict.fromkeys(str(uid) for uid in user_ids))
+        results: dict[str, float] = {}
+        if not ids:
+            return results
+        # Read-only so it can run on the read pool; users without a row get the
+        # same 0.7 default the SQL scoring path applies via COALESCE.
+        with self._connect() as conn:
+            for start in range(0, len(ids), SQL_MAX_IN_PARAMS):
+                chunk = ids[start : start + SQL_MAX_IN_PARAMS]
+                placeholders = ",".join(["?"] * len(chunk))
+                rows = conn.execute(
+                    f"""
+                    SELECT user_id, trust FROM user_trust
+                    WHERE group_id=? AND user_id IN ({placeholders})
+                    """,
+                    (group_id, *chunk),
+                ).fetchall()
+                for row in rows:
+                    results[row["user_id"]] = float(row["trust"])
+        for uid in ids:
+            results.setdefault(uid, 0.7)
+        return results
+
     def upsert_user_trust(self, group_id: str, user_id: str, trust: float) -> None:
         trust = max(0.0, min(1.0, trust))
         with self._connect() as conn:
@@ -803,61 +945,35 @@ class ImpressionStore:
             ).fetchone()
             return int(row["last_update"]) if row else 0
 
-    def set_group_last_update(self, group_id: str, ts: int) -> None:
-        with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO group_state (group_id, last_update)
-                VALUES (?, ?)
-                ON CONFLICT(group_id) DO UPDATE SET
-                    last_update=excluded.last_update
-                """,
-                (group_id, ts),
-            )
-            conn.commit()
-
-    def prune_evidence(
-        self,
-        group_id: str,
-        user_id: str,
-        item_type: str,
-        item_text: str,
-        max_items: int,
+    def complete_group_update(
+        self, group_id: str, ts: int, message_ids: Iterable[int]
     ) -> None:
-        if max_items <= 0:
-            return
         with self._connect() as conn:
-            rows = conn.execute(
-                """
-                SELECT id FROM impression_evidence
-                WHERE user_id=? AND item_type=? AND item_text=?
-                ORDER BY message_ts DESC, id DESC
-                LIMIT -1 OFFSET ?
-                """,
-                (user_id, item_type, item_text, max_items),
-            ).fetchall()
-            ids = [row["id"] for row in rows]
-            if not ids:
-                return
-            placeholders = ",".join(["?"] * len(ids))
-            conn.execute(
-                f"DELETE FROM impression_evidence WHERE id IN ({placeholders})",
-                ids,
-            )
+            conn.execute("BEGIN IMMEDIATE")
+            self._finish_group_update(conn, group_id, ts, message_ids)
             conn.commit()
 
-    def delete_evidence_for_item(
-        self, group_id: str, user_id: str, item_type: str, item_text: str
+    @staticmethod
+    def _finish_group_update(
+        conn: sqlite3.Connection, group_id: str, ts: int, message_ids: Iterable[int]
     ) -> None:
-        with self._connect() as conn:
+        ids = list(dict.fromkeys(message_ids))
+        conn.execute(
+            """
+            INSERT INTO group_state (group_id, last_update)
+            VALUES (?, ?)
+            ON CONFLICT(group_id) DO UPDATE SET
+                last_update=excluded.last_update
+            """,
+            (group_id, ts),
+        )
+        for start in range(0, len(ids), SQL_MAX_IN_PARAMS):
+            chunk = ids[start : start + SQL_MAX_IN_PARAMS]
+            placeholders = ",".join(["?"] * len(chunk))
             conn.execute(
-                """
-                DELETE FROM impression_evidence
-                WHERE user_id=? AND item_type=? AND item_text=?
-                """,
-                (user_id, item_type, item_text),
+                f"DELETE FROM message_queue WHERE id IN ({placeholders})",
+                chunk,
             )
-            conn.commit()
 
     def upsert_alias(
         self,
@@ -1024,12 +1140,40 @@ class ImpressionStore:
             )
             conn.commit()
 
+    @staticmethod
+    def _profile_params(
+        record: ProfileRecord, impressions_confidence: dict[str, float]
+    ) -> tuple:
+        return (
+            record.user_id,
+            record.nickname,
+            record.last_seen,
+            record.summary,
+            dumps_json(record.impressions),
+            dumps_json(impressions_confidence),
+            record.updated_at,
+            record.version,
+        )
+
+    @classmethod
+    def _profile_from_row(cls, row: sqlite3.Row) -> ProfileRecord:
+        return ProfileRecord(
+            user_id=row["user_id"],
+            nickname=row["nickname"],
+            last_seen=row["last_seen"],
+            summary=row["summary"],
+            impressions=cls._load_list(row["impressions"]),
+            impressions_confidence=cls._load_dict(row["impressions_confidence"]),
+            updated_at=row["updated_at"],
+            version=row["version"] or 1,
+        )
+
     @staticmethod
     def _load_list(value: str | None) -> list[str]:
         if not value:
             return []
         try:
-            data = json.loads(value)
+            data = loads_json(value)
         except json.JSONDecodeError:
             return []
         if isinstance(data, list):
@@ -1041,7 +1185,7 @@ class ImpressionStore:
         if not value:
             return {}
         try:
-            data = json.loads(value)
+            data = loads_json(value)
         except json.JSONDecodeError:
             return {}
         if isinstance(data, dict):
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_STORE_EXECUTOR: ThreadPoolExecutor | None = None
+# SQLite allows one writer at a time; funnelling writes through a single
+# thread avoids busy waits between pool threads holding the write lock.
+_WRITE_EXECUTOR: ThreadPoolExecutor | None = None
+# Large prompt builds and JSON parses run here so they neither block the event
+# loop nor queue behind SQLite hops on the store pool.
+_CPU_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+def configure_store_executor(max_workers: int) -> None:
+    global _STORE_EXECUTOR, _WRITE_EXECUTOR, _CPU_EXECUTOR
+    shutdown_store_executor()
+    _STORE_EXECUTOR = ThreadPoolExecutor(
+        max_workers=max(1, max_workers), thread_name_prefix="aic-store"
+    )
+    _WRITE_EXECUTOR = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="aic-writer"
+    )
+    _CPU_EXECUTOR = ThreadPoolExecutor(
+        max_workers=os.cpu_count() or 1, thread_name_prefix="aic-cpu"
+    )
+
+
+def shutdown_store_executor() -> None:
+    global _STORE_EXECUTOR, _WRITE_EXECUTOR, _CPU_EXECUTOR
+    if _STORE_EXECUTOR is not None:
+        _STORE_EXECUTOR.shutdown(wait=False)
+        _STORE_EXECUTOR = None
+    if _WRITE_EXECUTOR is not None:
+        _WRITE_EXECUTOR.shutdown(wait=False)
+        _WRITE_EXECUTOR = None
+    if _CPU_EXECUTOR is not None:
+        _CPU_EXECUTOR.shutdown(wait=False)
+        _CPU_EXECUTOR = None
+
+
+def to_thread(func, *args) -> asyncio.Future:
+    # run_in_executor skips the context copy asyncio.to_thread does; store calls
+    # never read contextvars. Falls back to the loop's default executor.
+    # Returning the future directly (not wrapping it in a coroutine) saves a
+    # frame per hop; callers await it the same way.
+    return asyncio.get_running_loop().run_in_executor(_STORE_EXECUTOR, func, *args)
+
+
+def to_writer(func, *args) -> asyncio.Future:
+    return asyncio.get_running_loop().run_in_executor(_WRITE_EXECUTOR, func, *args)
+
+
+def to_cpu(func, *args) -> asyncio.Future:
+    return asyncio.get_running_loop().run_in_executor(_CPU_EXECUTOR, func, *args)
@@ -1,29 +1,96 @@
 from __future__ import annotations
 
 import asyncio
+import io
 import math
 import time
+from collections import Counter
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterator
 
 from astrbot.api import logger
 from astrbot.core.exceptions import ProviderNotFoundError
 
+from .llm_cache import (
+    get_session_provider_id,
+    llm_generate_cached,
+    remember_llm_response,
+)
 from .prompts import (
     GROUP_ATTRIBUTION_SYSTEM_PROMPT,
     PHASE1_CANDIDATE_SYSTEM_PROMPT,
     PHASE2_MERGE_SYSTEM_PROMPT,
     PHASE3_SUMMARY_SYSTEM_PROMPT,
 )
-from .storage import ImpressionStore, ProfileRecord
+from .storage import EvidenceRow, GroupMessage, ImpressionStore, ProfileRecord
+from .store_executor import to_cpu, to_thread, to_writer
 from .utils import (
+    alias_tokens,
+    dumps_json,
     extract_target_ids_from_raw_text,
+    format_ts,
     parse_attribution_json,
     parse_phase1_candidates,
     parse_phase2_merge,
     parse_phase3_summaries,
+    write_json,
 )
-import re
 
 MAX_EVIDENCE_PER_ITEM = 3
+STRINGIO_MIN_MESSAGES = 256
+# Responses at least this long are parsed on the CPU executor; smaller ones
+# parse faster inline than the thread hop costs.
+CPU_OFFLOAD_MIN_CHARS = 64 * 1024
+# Phase 1 prompts covering more messages than this are built on the CPU
+# executor.
+CPU_OFFLOAD_MIN_MESSAGES = 256
+_SOURCE_WEIGHT = {"self": 1.0}
+_CONSISTENCY_WEIGHT = {"conflicting": 0.4, "neutral": 0.7}
+# Shared read-only defaults for lookups that miss; never mutate these.
+_EMPTY: tuple = ()
+_EMPTY_MAPPING = MappingProxyType({})
+_NL_TRANS = str.maketrans({"\n": " ", "\r": " "})
+# group_id -> [pending count, last update], kept current by
+# note_message_enqueued so the scheduler can skip the DB on the no-op path.
+# Dropped whenever an update runs; a miss falls back to the DB.
+_PENDING_STATE: dict[str, list[int]] = {}
+# Keys of scheduled (not forced) update/alias runs in flight; see
+# maybe_schedule_group_update.
+_SCHEDULED_KEYS: set[str] = set()
+
+
+@dataclass(slots=True)
+class GroupBatch:
+    pending: list[GroupMessage]
+    group_last_update: int
+    recent_profiles: list[ProfileRecord]
+    alias_index: dict[str, dict[str, list[str]]]
+
+
+def note_message_enqueued(group_id: str) -> None:
+    state = _PENDING_STATE.get(group_id)
+    if state is not None:
+        state[0] += 1
+
+
+def claim_scheduled_run(key: str) -> bool:
+    if key in _SCHEDULED_KEYS:
+        return False
+    _SCHEDULED_KEYS.add(key)
+    return True
+
+
+def release_scheduled_run(key: str) -> None:
+    _SCHEDULED_KEYS.discard(key)
+
+
+def get_update_lock(update_locks: dict[str, asyncio.Lock], key: str) -> asyncio.Lock:
+    # setdefault(key, asyncio.Lock()) would build a throwaway Lock on every hit.
+    lock = update_locks.get(key)
+    if lock is None:
+        lock = update_locks[key] = asyncio.Lock()
+    return lock
 
 
 async def maybe_schedule_group_update(
@@ -31,152 +98,120 @@ async def maybe_schedule_group_update(
     store: ImpressionStore,
     config,
     debug_log,
-    active_updates: set[str],
     update_locks: dict[str, asyncio.Lock],
     group_id: str,
     umo: str,
 ) -> None:
     key = f"group:{group_id}"
-    if key in active_updates:
+    # Skip instead of queueing behind another scheduled update for the group. A
+    # forced update does not mark the key, so a trigger arriving during one
+    # waits on the lock and runs after it.
+    if key in _SCHEDULED_KEYS:
         return
-    active_updates.add(key)
-    lock = update_locks.setdefault(key, asyncio.Lock())
-    async with lock:
-        try:
-            max_batch_messages = max(1, config.update_msg_threshold)
-            pending = await asyncio.to_thread(
-                store.get_pending_messages_by_group,
-                group_id,
-                max_batch_messages,
-            )
-            if not pending:
-                return
-            group_last_update = await asyncio.to_thread(
-                store.get_group_last_update, group_id
+    try:
+        state = _PENDING_STATE.get(group_id)
+        if state is None:
+            pending_count, group_last_update = await to_thread(
+                store.get_group_pending_state, group_id
             )
-            now = int(time.time())
-            if len(pending) < config.update_msg_threshold:
-                if group_last_update == 0:
-                    return
-                if now - group_last_update < config.update_time_threshold_sec:
+            _PENDING_STATE[group_id] = [pending_count, group_last_update]
+        else:
+            pending_count, group_last_update = state
+        if not _group_update_due(pending_count, group_last_update, config):
+            return
+        # Re-checked after the await, so only one of several concurrent
+        # triggers gets past here.
+        if not claim_scheduled_run(key):
+            return
+        try:
+            async with get_update_lock(update_locks, key):
+                # The update changes both numbers; the next trigger re-reads them.
+                _PENDING_STATE.pop(group_id, None)
+                max_batch_messages = max(1, config.update_msg_threshold)
+                batch = await to_thread(
+                    _load_group_batch,
+                    store,
+                    group_id,
+                    max_batch_messages,
+                    config.group_batch_known_users_max,
+                )
+                pending = batch.pending
+                group_last_update = batch.group_last_update
+                if not _group_update_due(len(pending), group_last_update, config):
                     return
-            debug_log(
-                "[AIC] Group update trigger: "
-                f"group={group_id} pending={len(pending)} "
-                f"threshold={config.update_msg_threshold} "
-                f"group_last_update={group_last_update} "
-                f"time_threshold={config.update_time_threshold_sec}"
-            )
-
-            recent_profiles = await asyncio.to_thread(
-                store.get_recent_profiles_by_group,
-                group_id,
-                config.group_batch_known_users_max,
-            )
-            nickname_by_user = {
-                p.user_id: (p.nickname or "").strip()
-                for p in recent_profiles
-                if p.nickname
-            }
-            nickname_to_user: dict[str, str] = {}
-            if config.group_batch_enable_nickname_match:
-                for user_id, nickname in nickname_by_user.items():
-                    if nickname and nickname not in nickname_to_user:
-                        nickname_to_user[nickname] = user_id
-
-            alias_index = await asyncio.to_thread(store.get_alias_index, group_id)
-
-            attribution_map: dict[int, list[str]] = {}
-            if config.group_batch_enable_semantic_attribution:
-                attribution_prompt = build_group_attribution_prompt(
-                    pending[
-                        : min(
-                            config.group_batch_attribution_max_messages,
-                            max_batch_messages,
-                        )
-                    ],
-                    recent_profiles,
-                    config.group_batch_attribution_include_summary,
+                pending = _bound_pending(pending, config, debug_log, group_id)
+                debug_log(
+                    "[AIC] Group update trigger: "
+                    f"group={group_id} pending={len(pending)} "
+                    f"threshold={config.update_msg_threshold} "
+                    f"group_last_update={group_last_update} "
+                    f"time_threshold={config.update_time_threshold_sec}"
                 )
-                start_ts = time.time()
-                debug_log("[AIC] Group attribution prompt:\n" + attribution_prompt)
-                provider_id = await _get_provider_id(
-                    context, config, umo, config.attribution_provider_id
+                await _update_group_batch(
+                    context,
+                    store,
+                    config,
+                    debug_log,
+                    group_id,
+                    umo,
+                    batch,
+                    pending,
+                    forced=False,
                 )
-                if provider_id:
-                    try:
-                        resp = await context.llm_generate(
-                            chat_provider_id=provider_id,
-                            system_prompt=GROUP_ATTRIBUTION_SYSTEM_PROMPT,
-                            prompt=attribution_prompt,
-                        )
-                        raw_text = resp.completion_text or ""
-                        debug_log(
-                            f"[AIC] Group attribution duration: {time.time() - start_ts:.2f}s"
-                        )
-                        debug_log("[AIC] Group attribution raw response:\n" + raw_text)
-                        attribution_map, _ = parse_attribution_json(
-                            raw_text, {p.user_id for p in recent_profiles}
-                        )
-                    except Exception as exc:  # noqa: BLE001
-                        logger.warning(f"LLM group attribution failed: {exc}")
-
-            pending_by_user = _build_pending_by_user(
-                pending,
-                attribution_map,
-                nickname_to_user,
-                alias_index,
-                config.bot_user_id,
-                set(config.bot_aliases),
-            )
-            if not pending_by_user:
-                return
+        finally:
+            release_scheduled_run(key)
+    except Exception as exc:  # noqa: BLE001
+        logger.error(f"Group impression update failed: {exc}")
 
-            eligible_users = await _select_eligible_users(
-                store,
-                group_id,
-                pending_by_user,
-                config,
-                debug_log,
-            )
-            if not eligible_users:
-                return
 
-            pending_by_user = {
-                user_id: msgs
-                for user_id, msgs in pending_by_user.items()
-                if user_id in eligible_users
-            }
-            if not pending_by_user:
-                return
+def _load_group_batch(
+    store: ImpressionStore,
+    group_id: str,
+    max_batch_messages: int,
+    known_users_max: int,
+) -> GroupBatch:
+    # One worker-thread hop for every read the batch needs before the LLM calls.
+    return GroupBatch(
+        pending=store.get_pending_messages_by_group(group_id, max_batch_messages),
+        group_last_update=store.get_group_last_update(group_id),
+        recent_profiles=store.get_recent_profiles_by_group(group_id, known_users_max),
+        alias_index=store.get_alias_index(group_id),
+    )
 
-            profiles_by_user = {
-                user_id: await asyncio.to_thread(store.get_profile, user_id)
-                for user_id in pending_by_user.keys()
-            }
 
-            ok = await _run_phase_updates(
-                context,
-                store,
-                config,
-                debug_log,
-                group_id,
-                pending_by_user,
-                profiles_by_user,
-                umo,
-                clear_old_user_ids=set(),
+def _bound_pending(
+    pending: list[GroupMessage], config, debug_log, group_id: str
+) -> list[GroupMessage]:
+    # Keeps the ts-ordered prefix that fits the prompt budget, counting each
+    # message as clipped in the prompt. Messages themselves are not modified:
+    # target markers and stored evidence need the full text. Dropped messages
+    # are never marked processed, so they stay queued for the next run. The
+    # first message is always kept.
+    max_message_chars = config.group_batch_max_message_chars
+    max_prompt_chars = config.group_batch_max_prompt_chars
+    if max_prompt_chars <= 0:
+        return pending
+    total = 0
+    for idx, msg in enumerate(pending):
+        size = len(msg.message)
+        total += min(size, max_message_chars) if max_message_chars > 0 else size
+        if total > max_prompt_chars and idx > 0:
+            debug_log(
+                f"[AIC] Group batch truncated for {group_id}: "
+                f"kept={idx}/{len(pending)} max_prompt_chars={max_prompt_chars}"
             )
-            if ok:
-                await asyncio.to_thread(
-                    store.set_group_last_update, group_id, int(time.time())
-                )
-                delete_ids = [msg.id for msgs in pending_by_user.values() for msg in msgs]
-                if delete_ids:
-                    await asyncio.to_thread(store.delete_pending_messages, delete_ids)
-        except Exception as exc:  # noqa: BLE001
-            logger.error(f"Group impression update failed: {exc}")
-        finally:
-            active_updates.discard(key)
+            return pending[:idx]
+    return pending
+
+
+def _group_update_due(pending_count: int, group_last_update: int, config) -> bool:
+    if pending_count <= 0:
+        return False
+    if pending_count >= config.update_msg_threshold:
+        return True
+    if group_last_update == 0:
+        return False
+    return int(time.time()) - group_last_update >= config.update_time_threshold_sec
 
 
 async def force_group_update(
@@ -189,214 +224,259 @@ async def force_group_update(
     group_id: str,
 ) -> bool:
     key = f"group:{group_id}"
-    lock = update_locks.setdefault(key, asyncio.Lock())
+    lock = get_update_lock(update_locks, key)
     async with lock:
+        _PENDING_STATE.pop(group_id, None)
         max_batch_messages = max(1, config.update_msg_threshold)
-        pending = await asyncio.to_thread(
-            store.get_pending_messages_by_group,
+        batch = await to_thread(
+            _load_group_batch,
+            store,
             group_id,
             max_batch_messages,
+            config.group_batch_known_users_max,
         )
+        pending = batch.pending
         if not pending:
             return False
-
-        recent_profiles = await asyncio.to_thread(
-            store.get_recent_profiles_by_group,
+        pending = _bound_pending(pending, config, debug_log, group_id)
+        return await _update_group_batch(
+            context,
+            store,
+            config,
+            debug_log,
             group_id,
-            config.group_batch_known_users_max,
-        )
-        nickname_by_user = {
-            p.user_id: (p.nickname or "").strip()
-            for p in recent_profiles
-            if p.nickname
-        }
-        nickname_to_user: dict[str, str] = {}
-        if config.group_batch_enable_nickname_match:
-            for user_id, nickname in nickname_by_user.items():
-                if nickname and nickname not in nickname_to_user:
-                    nickname_to_user[nickname] = user_id
-        alias_index = await asyncio.to_thread(store.get_alias_index, group_id)
-
-        attribution_map: dict[int, list[str]] = {}
-        if config.group_batch_enable_semantic_attribution:
-            attribution_prompt = build_group_attribution_prompt(
-                pending[
-                    : min(
-                        config.group_batch_attribution_max_messages,
-                        max_batch_messages,
-                    )
-                ],
-                recent_profiles,
-                config.group_batch_attribution_include_summary,
-            )
-            start_ts = time.time()
-            debug_log("[AIC] Group attribution prompt:\n" + attribution_prompt)
-            provider_id = await _get_provider_id(
-                context, config, umo, config.attribution_provider_id
-            )
-            if provider_id:
-                try:
-                    resp = await context.llm_generate(
-                        chat_provider_id=provider_id,
-                        system_prompt=GROUP_ATTRIBUTION_SYSTEM_PROMPT,
-                        prompt=attribution_prompt,
-                    )
-                    raw_text = resp.completion_text or ""
-                    debug_log(
-                        f"[AIC] Group attribution duration: {time.time() - start_ts:.2f}s"
-                    )
-                    debug_log("[AIC] Group attribution raw response:\n" + raw_text)
-                    attribution_map, _ = parse_attribution_json(
-                        raw_text, {p.user_id for p in recent_profiles}
-                    )
-                except Exception as exc:  # noqa: BLE001
-                    logger.warning(f"LLM group attribution failed: {exc}")
-
-        pending_by_user = _build_pending_by_user(
+            umo,
+            batch,
             pending,
-            attribution_map,
-            nickname_to_user,
-            alias_index,
-            config.bot_user_id,
-            set(config.bot_aliases),
+            forced=True,
         )
-        if not pending_by_user:
-            return False
 
-        profiles_by_user = {
-            user_id: await asyncio.to_thread(store.get_profile, user_id)
-            for user_id in pending_by_user.keys()
-        }
 
-        ok = await _run_phase_updates(
+async def _update_group_batch(
+    context,
+    store: ImpressionStore,
+    config,
+    debug_log,
+    group_id: str,
+    umo: str,
+    batch: GroupBatch,
+    pending: list[GroupMessage],
+    *,
+    forced: bool,
+) -> bool:
+    # Shared by the scheduled and forced paths once the batch is loaded and
+    # bounded; only scheduled updates filter users by eligibility.
+    nickname_by_user = {
+        p.user_id: (p.nickname or "").strip()
+        for p in batch.recent_profiles
+        if p.nickname
+    }
+    nickname_to_user: dict[str, str] = {}
+    if config.group_batch_enable_nickname_match:
+        for user_id, nickname in nickname_by_user.items():
+            if nickname and nickname not in nickname_to_user:
+                nickname_to_user[nickname] = user_id
+
+    provider_cache: dict[str, str] = {}
+    max_batch_messages = max(1, config.update_msg_threshold)
+    attribution_window = pending[
+        : min(config.group_batch_attribution_max_messages, max_batch_messages)
+    ]
+    direct_targets = _resolve_direct_targets(
+        pending,
+        nickname_to_user,
+        batch.alias_index,
+        config.bot_user_id,
+        config.bot_alias_set,
+    )
+    # Speaker trust only depends on who sent the pending messages, so read
+    # it while the attribution LLM call is in flight.
+    attribution_map, trust_scores = await asyncio.gather(
+        _run_group_attribution(
             context,
-            store,
             config,
             debug_log,
+            umo,
+            attribution_window,
+            batch.recent_profiles,
+            direct_targets,
+            provider_cache=provider_cache,
+        ),
+        to_thread(store.get_user_trusts, group_id, {msg.user_id for msg in pending}),
+    )
+    pending_by_user, last_seen_by_user = _build_pending_by_user(
+        pending, direct_targets, attribution_map
+    )
+    if not forced:
+        eligible_users = _select_eligible_users(
             group_id,
             pending_by_user,
-            profiles_by_user,
-            umo,
-            clear_old_user_ids=set(),
+            batch.group_last_update,
+            config,
+            debug_log,
+        )
+        pending_by_user = {
+            user_id: msgs
+            for user_id, msgs in pending_by_user.items()
+            if user_id in eligible_users
+        }
+    if not pending_by_user:
+        return False
+
+    profiles_by_user = await to_thread(store.get_profiles, list(pending_by_user))
+
+    return await _run_phase_updates(
+        context,
+        store,
+        config,
+        debug_log,
+        group_id,
+        pending_by_user,
+        profiles_by_user,
+        last_seen_by_user,
+        trust_scores,
+        umo,
+        clear_old_user_ids=set(),
+        provider_cache=provider_cache,
+    )
+
+
+async def _run_group_attribution(
+    context,
+    config,
+    debug_log,
+    umo: str,
+    window,
+    recent_profiles: list[ProfileRecord],
+    direct_targets: dict[int, list[str]],
+    *,
+    provider_cache: dict[str, str] | None = None,
+) -> dict[int, list[str]]:
+    if not config.group_batch_enable_semantic_attribution or not window:
+        return {}
+    unresolved = sum(1 for msg in window if not direct_targets.get(msg.id))
+    if unresolved / len(window) <= config.group_batch_attribution_skip_ratio:
+        debug_log(
+            "[AIC] Group attribution skipped: "
+            f"unresolved={unresolved}/{len(window)} "
+            f"skip_ratio={config.group_batch_attribution_skip_ratio}"
+        )
+        return {}
+
+    attribution_prompt = build_group_attribution_prompt(
+        window,
+        recent_profiles,
+        config.group_batch_attribution_include_summary,
+        config.group_batch_max_message_chars,
+    )
+    start_ts = time.time()
+    debug_log("[AIC] Group attribution prompt:\n", attribution_prompt)
+    provider_id = await _get_provider_id(
+        context,
+        config,
+        umo,
+        config.attribution_provider_id,
+        provider_cache=provider_cache,
+    )
+    if not provider_id:
+        return {}
+    try:
+        raw_text, cache_key = await llm_generate_cached(
+            context,
+            debug_log,
+            provider_id,
+            GROUP_ATTRIBUTION_SYSTEM_PROMPT,
+            attribution_prompt,
+        )
+        debug_log(f"[AIC] Group attribution duration: {time.time() - start_ts:.2f}s")
+        debug_log("[AIC] Group attribution raw response:\n", raw_text)
+        attribution_map, ok = await _parse_response(
+            parse_attribution_json, raw_text, {p.user_id for p in recent_profiles}
         )
         if ok:
-            await asyncio.to_thread(
-                store.set_group_last_update, group_id, int(time.time())
-            )
-            delete_ids = [msg.id for msgs in pending_by_user.values() for msg in msgs]
-            if delete_ids:
-                await asyncio.to_thread(store.delete_pending_messages, delete_ids)
-        return ok
+            remember_llm_response(cache_key, raw_text)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning(f"LLM group attribution failed: {exc}")
+        return {}
+    return attribution_map
 
 
-def _build_pending_by_user(
+def _resolve_direct_targets(
     pending,
-    attribution_map,
     nickname_to_user,
     alias_index: dict[str, dict[str, list[str]]],
     bot_user_id: str,
-    bot_aliases: set[str],
-) -> dict[str, list]:
-    pending_by_user: dict[str, list] = {}
+    bot_aliases: frozenset[str],
+) -> dict[int, list[str]]:
+    direct_targets: dict[int, list[str]] = {}
+    check_bot = bool(bot_user_id and bot_aliases)
     for msg in pending:
         targets = list(extract_target_ids_from_raw_text(msg.message))
 
-        if not targets:
-            bot_targets = _resolve_bot_alias_targets(msg.message, bot_user_id, bot_aliases)
-            targets.extend(bot_targets)
-
-        if not targets:
-            alias_targets = _resolve_alias_targets(
-                msg.user_id, msg.message, alias_index
-            )
-            targets.extend(alias_targets)
-
-        if not targets and nickname_to_user:
-            nickname_targets = _resolve_nickname_targets(msg.message, nickname_to_user)
-            targets.extend(nickname_targets)
-
-        if not targets:
-            targets = attribution_map.get(msg.id, [])
+        speaker_map = alias_index.get(str(msg.user_id), {}) if not targets else {}
+        # Tokenize once per message, and not at all when no lookup could hit.
+        if not targets and (check_bot or speaker_map or nickname_to_user):
+            tokens = alias_tokens(msg.message)
+            if check_bot and not bot_aliases.isdisjoint(tokens):
+                targets = [bot_user_id]
+            else:
+                alias_hits: dict[str, None] = {}
+                nickname_hits: dict[str, None] = {}
+                for token in tokens:
+                    for target_id in speaker_map.get(token, ()):
+                        alias_hits[target_id] = None
+                    target_id = nickname_to_user.get(token)
+                    if target_id:
+                        nickname_hits[target_id] = None
+                targets = list(alias_hits or nickname_hits)
 
-        if targets:
-            for target_id in targets:
-                pending_by_user.setdefault(target_id, []).append(msg)
-        else:
-            pending_by_user.setdefault(msg.user_id, []).append(msg)
-    return pending_by_user
+        direct_targets[msg.id] = targets
+    return direct_targets
 
 
-def _resolve_bot_alias_targets(
-    message: str, bot_user_id: str, bot_aliases: set[str]
-) -> list[str]:
-    if not bot_user_id or not bot_aliases:
-        return []
-    tokens = _extract_tokens(message)
-    for token in tokens:
-        if token in bot_aliases:
-            return [bot_user_id]
-    return []
+def _build_pending_by_user(
+    pending,
+    direct_targets: dict[int, list[str]],
+    attribution_map: dict[int, list[str]],
+) -> tuple[dict[str, list], dict[str, int]]:
+    pending_by_user: dict[str, list] = {}
+    # pending is ordered by ts, so the last message bucketed for a user is
+    # their latest one.
+    last_seen_by_user: dict[str, int] = {}
+    for msg in pending:
+        targets = direct_targets.get(msg.id) or attribution_map.get(msg.id) or (
+            msg.user_id,
+        )
+        for target_id in targets:
+            pending_by_user.setdefault(target_id, []).append(msg)
+            last_seen_by_user[target_id] = msg.ts
+    return pending_by_user, last_seen_by_user
 
 
-def _resolve_alias_targets(
-    speaker_id: str,
-    message: str,
-    alias_index: dict[str, dict[str, list[str]]],
-) -> list[str]:
-    speaker_map = alias_index.get(str(speaker_id), {})
-    if not speaker_map:
-        return []
-    tokens = _extract_tokens(message)
-    targets: list[str] = []
-    for token in tokens:
-        if token in speaker_map:
-            for target_id in speaker_map[token]:
-                if target_id not in targets:
-                    targets.append(target_id)
-    return targets
-
-
-def _resolve_nickname_targets(
-    message: str, nickname_to_user: dict[str, str]
-) -> list[str]:
-    tokens = _extract_tokens(message)
-    targets: list[str] = []
-    for token in tokens:
-        target_id = nickname_to_user.get(token)
-        if target_id and target_id not in targets:
-            targets.append(target_id)
-    return targets
-
-
-def _extract_tokens(text: str) -> list[str]:
-    if not text:
-        return []
-    return re.findall(r"[\\w\\u4e00-\\u9fff]{2,16}", text)
-
-
-async def _select_eligible_users(
-    store: ImpressionStore,
+def _select_eligible_users(
     group_id: str,
     pending_by_user: dict[str, list],
+    group_last_update: int,
     config,
     debug_log,
-) -> list[str]:
-    eligible: list[str] = []
-    now = int(time.time())
-    group_last_update = await asyncio.to_thread(store.get_group_last_update, group_id)
+) -> set[str]:
+    # The time condition is per group, so it is the same for every user.
+    time_due = (
+        group_last_update != 0
+        and int(time.time()) - group_last_update >= config.update_time_threshold_sec
+    )
+    threshold = config.update_msg_threshold
+    eligible: set[str] = set()
     for user_id, msgs in pending_by_user.items():
         pending_count = len(msgs)
-        if pending_count >= config.update_msg_threshold:
+        if pending_count >= threshold:
             debug_log(
                 f"[AIC] Auto update threshold reached for {group_id}:{user_id} "
-                f"(pending={pending_count}, threshold={config.update_msg_threshold})"
+                f"(pending={pending_count}, threshold={threshold})"
             )
-            eligible.append(user_id)
-            continue
-        if group_last_update == 0:
-            continue
-        if now - group_last_update >= config.update_time_threshold_sec:
-            eligible.append(user_id)
+            eligible.add(user_id)
+        elif time_due:
+            eligible.add(user_id)
     return eligible
 
 
@@ -408,53 +488,94 @@ async def _run_phase_updates(
     group_id: str,
     pending_by_user: dict[str, list],
     profiles_by_user: dict[str, ProfileRecord | None],
+    last_seen_by_user: dict[str, int],
+    trust_scores: dict[str, float],
     umo: str,
     clear_old_user_ids: set[str],
+    *,
+    provider_cache: dict[str, str] | None = None,
 ) -> bool:
     if not pending_by_user:
         return False
 
     provider_id = await _get_provider_id(
-        context, config, umo, config.phase1_provider_id
+        context,
+        config,
+        umo,
+        config.phase1_provider_id,
+        provider_cache=provider_cache,
     )
     if not provider_id:
         return False
 
     known_user_ids = set(pending_by_user.keys())
-    nickname_by_user = {
-        user_id: (profiles_by_user.get(user_id).nickname or "")
-        if profiles_by_user.get(user_id)
-        else ""
-        for user_id in known_user_ids
-    }
-
-    phase1_prompt = build_phase1_prompt(pending_by_user, known_user_ids, nickname_by_user)
+    # Sorted once; every per-user loop and the phase 1 prompt reuse this order.
+    sorted_user_ids = sorted(known_user_ids)
+    nickname_by_user: dict[str, str] = {}
+    summary_by_user: dict[str, str] = {}
+    version_by_user: dict[str, int] = {}
+    for user_id in sorted_user_ids:
+        profile = profiles_by_user.get(user_id)
+        nickname_by_user[user_id] = (profile.nickname if profile else "") or ""
+        summary_by_user[user_id] = (profile.summary if profile else "") or ""
+        version_by_user[user_id] = profile.version if profile else 1
+
+    message_total = sum(map(len, pending_by_user.values()))
+    if message_total > CPU_OFFLOAD_MIN_MESSAGES:
+        phase1_prompt = await to_cpu(
+            build_phase1_prompt,
+            pending_by_user,
+            sorted_user_ids,
+            nickname_by_user,
+            config.group_batch_max_message_chars,
+            message_total,
+        )
+    else:
+        phase1_prompt = build_phase1_prompt(
+            pending_by_user,
+            sorted_user_ids,
+            nickname_by_user,
+            config.group_batch_max_message_chars,
+            message_total,
+        )
     phase1_start = time.time()
-    debug_log("[AIC] Phase1 prompt:\n" + phase1_prompt)
+    debug_log("[AIC] Phase1 prompt:\n", phase1_prompt)
     try:
-            resp = await context.llm_generate(
-                chat_provider_id=provider_id,
-                system_prompt=PHASE1_CANDIDATE_SYSTEM_PROMPT,
-                prompt=phase1_prompt,
-            )
+        raw_text, cache_key = await llm_generate_cached(
+            context,
+            debug_log,
+            provider_id,
+            PHASE1_CANDIDATE_SYSTEM_PROMPT,
+            phase1_prompt,
+        )
     except Exception as exc:  # noqa: BLE001
         logger.error(f"LLM phase1 call failed: {exc}")
         return False
-    raw_text = resp.completion_text or ""
     debug_log(f"[AIC] Phase1 duration: {time.time() - phase1_start:.2f}s")
-    debug_log("[AIC] Phase1 raw response:\n" + raw_text)
-    phase1_data, ok = parse_phase1_candidates(raw_text, known_user_ids)
+    debug_log("[AIC] Phase1 raw response:\n", raw_text)
+    phase1_data, ok = await _parse_response(
+        parse_phase1_candidates, raw_text, known_user_ids
+    )
     if not ok:
         logger.warning("LLM phase1 returned invalid JSON")
         return False
+    remember_llm_response(cache_key, raw_text)
 
+    # Every message in the batch is consumed once phase 1 succeeds. One walk
+    # over the batch yields both the id index used for evidence lookups and
+    # the (deduplicated) ids to dequeue.
+    pending_by_id = {msg.id: msg for msgs in pending_by_user.values() for msg in msgs}
+    message_ids = list(pending_by_id)
     candidate_by_user = _normalize_phase1_candidates(phase1_data)
     if not candidate_by_user:
+        await to_writer(
+            store.complete_group_update, group_id, int(time.time()), message_ids
+        )
         return True
 
     existing_by_user = {}
     users_for_merge = set()
-    for user_id in known_user_ids:
+    for user_id in sorted_user_ids:
         profile = profiles_by_user.get(user_id)
         existing_impressions = (
             profile.impressions if profile and user_id not in clear_old_user_ids else []
@@ -470,34 +591,42 @@ async def _run_phase_updates(
     consistency_by_user: dict[str, dict] = {}
 
     if users_for_merge:
+        # Sorted payloads keep the prompt bytes stable between runs, which
+        # lets providers with prefix caching reuse them.
+        merge_ids = sorted(users_for_merge)
         phase2_prompt = build_phase2_prompt(
-            {uid: existing_by_user[uid] for uid in users_for_merge},
-            {
-                uid: candidate_by_user.get(uid, {"impressions": {}})
-                for uid in users_for_merge
-            },
+            {uid: existing_by_user[uid] for uid in merge_ids},
+            {uid: candidate_by_user.get(uid, _EMPTY_MAPPING) for uid in merge_ids},
         )
         phase2_start = time.time()
-        debug_log("[AIC] Phase2 prompt:\n" + phase2_prompt)
+        debug_log("[AIC] Phase2 prompt:\n", phase2_prompt)
         try:
             phase2_provider_id = await _get_provider_id(
-                context, config, umo, config.phase2_provider_id
+                context,
+                config,
+                umo,
+                config.phase2_provider_id,
+                provider_cache=provider_cache,
             )
-            resp = await context.llm_generate(
-                chat_provider_id=phase2_provider_id,
-                system_prompt=PHASE2_MERGE_SYSTEM_PROMPT,
-                prompt=phase2_prompt,
+            raw_text, cache_key = await llm_generate_cached(
+                context,
+                debug_log,
+                phase2_provider_id,
+                PHASE2_MERGE_SYSTEM_PROMPT,
+                phase2_prompt,
             )
         except Exception as exc:  # noqa: BLE001
             logger.error(f"LLM phase2 call failed: {exc}")
             return False
-        raw_text = resp.completion_text or ""
         debug_log(f"[AIC] Phase2 duration: {time.time() - phase2_start:.2f}s")
-        debug_log("[AIC] Phase2 raw response:\n" + raw_text)
-        phase2_data, ok = parse_phase2_merge(raw_text, users_for_merge)
+        debug_log("[AIC] Phase2 raw response:\n", raw_text)
+        phase2_data, ok = await _parse_response(
+            parse_phase2_merge, raw_text, users_for_merge
+        )
         if not ok:
             logger.warning("LLM phase2 returned invalid JSON")
             return False
+        remember_llm_response(cache_key, raw_text)
         for user_id, payload in phase2_data.items():
             final_by_user[user_id] = {
                 "impressions": payload.get("impressions", []),
@@ -505,11 +634,11 @@ async def _run_phase_updates(
             mapping_by_user[user_id] = payload.get("mapping", {})
             consistency_by_user[user_id] = payload.get("consistency", {})
 
-    for user_id in known_user_ids:
+    for user_id in sorted_user_ids:
         if user_id in final_by_user:
             continue
-        candidates = candidate_by_user.get(user_id, {"impressions": {}})
-        final_impressions = list(candidates.get("impressions", {}).keys())
+        candidates = candidate_by_user.get(user_id, _EMPTY_MAPPING)
+        final_impressions = list(candidates.get("impressions", _EMPTY_MAPPING))
         final_by_user[user_id] = {"impressions": final_impressions}
         mapping_by_user[user_id] = {
             "impressions": {t: [t] for t in final_impressions},
@@ -520,117 +649,129 @@ async def _run_phase_updates(
 
     summaries: dict[str, str] = {}
     if _should_run_phase3(final_by_user, profiles_by_user, users_for_merge):
-        summary_prompt = build_phase3_prompt(final_by_user, profiles_by_user)
+        summary_prompt = build_phase3_prompt(final_by_user, summary_by_user)
         phase3_start = time.time()
-        debug_log("[AIC] Phase3 prompt:\n" + summary_prompt)
+        debug_log("[AIC] Phase3 prompt:\n", summary_prompt)
         try:
             phase3_provider_id = await _get_provider_id(
-                context, config, umo, config.phase3_provider_id
+                context,
+                config,
+                umo,
+                config.phase3_provider_id,
+                provider_cache=provider_cache,
             )
-            resp = await context.llm_generate(
-                chat_provider_id=phase3_provider_id,
-                system_prompt=PHASE3_SUMMARY_SYSTEM_PROMPT,
-                prompt=summary_prompt,
+            raw_text, cache_key = await llm_generate_cached(
+                context,
+                debug_log,
+                phase3_provider_id,
+                PHASE3_SUMMARY_SYSTEM_PROMPT,
+                summary_prompt,
             )
         except Exception as exc:  # noqa: BLE001
             logger.error(f"LLM phase3 call failed: {exc}")
             return False
-        raw_text = resp.completion_text or ""
         debug_log(f"[AIC] Phase3 duration: {time.time() - phase3_start:.2f}s")
-        debug_log("[AIC] Phase3 raw response:\n" + raw_text)
-        summaries, ok = parse_phase3_summaries(raw_text, known_user_ids)
+        debug_log("[AIC] Phase3 raw response:\n", raw_text)
+        summaries, ok = await _parse_response(
+            parse_phase3_summaries, raw_text, known_user_ids
+        )
         if not ok:
             logger.warning("LLM phase3 returned invalid JSON")
             summaries = {}
+        else:
+            remember_llm_response(cache_key, raw_text)
 
     now = int(time.time())
-    pending_by_id = {msg.id: msg for msgs in pending_by_user.values() for msg in msgs}
-    trust_scores = {
-        uid: await asyncio.to_thread(store.get_user_trust, group_id, uid)
-        for uid in {msg.user_id for msg in pending_by_id.values()}
-    }
 
-    for user_id in known_user_ids:
-        profile = profiles_by_user.get(user_id)
-        nickname = profile.nickname if profile and profile.nickname else user_id
-        last_seen = max(m.ts for m in pending_by_user[user_id])
-        summary = summaries.get(user_id) or (profile.summary if profile else "") or ""
+    records: list[ProfileRecord] = []
+    evidence_records: list[tuple] = []
+    prune_keys: list[tuple[str, str, str]] = []
+    for user_id in sorted_user_ids:
         final_impressions = final_by_user[user_id]["impressions"]
-        evidence_records = build_evidence_records(
+        user_evidence = build_evidence_records(
             group_id,
             user_id,
             final_impressions,
-            mapping_by_user.get(user_id, {}),
-            consistency_by_user.get(user_id, {}),
-            candidate_by_user.get(user_id, {}),
+            mapping_by_user.get(user_id, _EMPTY_MAPPING),
+            consistency_by_user.get(user_id, _EMPTY_MAPPING),
+            candidate_by_user.get(user_id, _EMPTY_MAPPING),
             pending_by_id,
             now,
         )
-        if evidence_records:
-            await asyncio.to_thread(store.insert_evidence, evidence_records)
-            _prune_evidence(store, group_id, user_id, final_impressions)
-        impression_conf_map = _recompute_confidence_map(
-            store, group_id, user_id, "impression", final_impressions, trust_scores, config
-        )
-        filtered_impressions = []
-        for item in final_impressions:
-            conf = impression_conf_map.get(item, 0.0)
-            if conf >= config.impression_confidence_min:
-                filtered_impressions.append(item)
-            else:
-                await asyncio.to_thread(
-                    store.delete_evidence_for_item,
-                    group_id,
-                    user_id,
-                    "impression",
-                    item,
-                )
-                impression_conf_map.pop(item, None)
-        final_impressions = filtered_impressions
-
-        if impression_conf_map:
-            order = {item: idx for idx, item in enumerate(final_impressions)}
-            final_impressions.sort(
-                key=lambda x: (-float(impression_conf_map.get(x, 0.0)), order.get(x, 0))
+        if user_evidence:
+            evidence_records.extend(user_evidence)
+            prune_keys.extend((user_id, "impression", item) for item in final_impressions)
+        records.append(
+            ProfileRecord(
+                user_id=user_id,
+                nickname=nickname_by_user[user_id] or user_id,
+                last_seen=last_seen_by_user[user_id],
+                summary=summaries.get(user_id) or summary_by_user[user_id],
+                impressions=final_impressions,
+                impressions_confidence={},
+                updated_at=now,
+                version=version_by_user[user_id],
             )
-
-        record = ProfileRecord(
-            user_id=user_id,
-            nickname=nickname,
-            last_seen=last_seen,
-            summary=summary,
-            impressions=final_impressions,
-            impressions_confidence=impression_conf_map,
-            updated_at=now,
-            version=(profile.version if profile else 1),
-        )
-        await asyncio.to_thread(
-            store.upsert_profile_with_confidence,
-            record,
-            impression_conf_map,
         )
+    await to_writer(
+        store.bulk_insert_evidence, evidence_records, prune_keys, MAX_EVIDENCE_PER_ITEM
+    )
 
+    # Scoring only reads; the store read pool bounds how many run at once.
+    dropped = await asyncio.gather(
+        *(
+            to_thread(_score_user_sync, store, group_id, record, trust_scores, config)
+            for record in records
+        )
+    )
+    await to_writer(
+        store.commit_group_update,
+        group_id,
+        now,
+        message_ids,
+        [key for keys in dropped for key in keys],
+        records,
+    )
     return True
 
 
 async def _get_provider_id(
-    context, config, umo: str, provider_override: str | None = None
+    context,
+    config,
+    umo: str,
+    provider_override: str | None = None,
+    *,
+    provider_cache: dict[str, str] | None = None,
 ) -> str:
+    # provider_cache lives for one update, so the session provider lookup runs
+    # at most once per distinct override.
+    override = (provider_override or "").strip()
+    if provider_cache is not None and override in provider_cache:
+        return provider_cache[override]
     try:
-        return (
-            (provider_override or "").strip()
+        provider_id = (
+            override
             or config.update_provider_id
-            or await context.get_current_chat_provider_id(umo=umo)
+            or await get_session_provider_id(context, umo)
         )
     except ProviderNotFoundError as exc:
         logger.warning(f"No LLM provider configured: {exc}")
-        return ""
+        provider_id = ""
+    if provider_cache is not None:
+        provider_cache[override] = provider_id
+    return provider_id
+
+
+async def _parse_response(parse, raw_text: str, *args):
+    if len(raw_text) < CPU_OFFLOAD_MIN_CHARS:
+        return parse(raw_text, *args)
+    return await to_cpu(parse, raw_text, *args)
 
 
 def _normalize_phase1_candidates(raw: dict[str, dict[str, list[dict]]]) -> dict[str, dict]:
     results: dict[str, dict] = {}
     for user_id, payload in raw.items():
-        impressions = _normalize_candidate_items(payload.get("impressions", []))
+        impressions = _normalize_candidate_items(payload.get("impressions", _EMPTY))
         results[user_id] = {"impressions": impressions}
     return results
 
@@ -683,9 +824,11 @@ def _normalize_candidate_items(items: list[dict]) -> dict[str, list[dict]]:
                 }
             )
         existing = results.get(text, [])
+        seen_ids = {s["evidence_id"] for s in existing}
         for signal in signals:
-            if signal["evidence_id"] not in {s["evidence_id"] for s in existing}:
+            if signal["evidence_id"] not in seen_ids:
                 existing.append(signal)
+                seen_ids.add(signal["evidence_id"])
         results[text] = existing
     return results
 
@@ -694,17 +837,47 @@ def _clamp(value: float, low: float = 0.0, high: float = 1.0) -> float:
     return max(low, min(high, value))
 
 
-def _prune_evidence(
+def _score_user_sync(
     store: ImpressionStore,
     group_id: str,
-    user_id: str,
-    impressions: list[str],
-) -> None:
-    for item_text in impressions:
-        store.prune_evidence(
-            group_id, user_id, "impression", item_text, MAX_EVIDENCE_PER_ITEM
+    record: ProfileRecord,
+    trust_scores: dict[str, float],
+    config,
+) -> list[tuple[str, str, str]]:
+    # Runs in a worker thread. Filters and orders record.impressions by
+    # confidence in place and returns the evidence keys of dropped items.
+    user_id = record.user_id
+    final_impressions = record.impressions
+    impression_conf_map = _recompute_confidence_map(
+        store,
+        group_id,
+        user_id,
+        "impression",
+        final_impressions,
+        trust_scores,
+        config,
+    )
+    filtered_impressions = []
+    dropped: list[tuple[str, str, str]] = []
+    for item in final_impressions:
+        conf = impression_conf_map.get(item, 0.0)
+        if conf >= config.impression_confidence_min:
+            filtered_impressions.append(item)
+        else:
+            dropped.append((user_id, "impression", item))
+            impression_conf_map.pop(item, None)
+    final_impressions = filtered_impressions
+
+    if impression_conf_map:
+        order = {item: idx for idx, item in enumerate(final_impressions)}
+        final_impressions.sort(
+            key=lambda x: (-float(impression_conf_map.get(x, 0.0)), order.get(x, 0))
         )
 
+    record.impressions = final_impressions
+    record.impressions_confidence = impression_conf_map
+    return dropped
+
 
 def build_evidence_records(
     group_id: str,
@@ -790,151 +963,247 @@ def _recompute_confidence_map(
     result: dict[str, float] = {}
     half_life_days = max(0.0, float(config.evidence_half_life_days))
     half_life_sec = half_life_days * 86400.0
-    now = time.time()
+    now = int(time.time())
+    if store.supports_math_functions:
+        scores = store.get_confidence_scores(
+            group_id, user_id, item_type, items, now, half_life_sec
+        )
+        return {item_text: _clamp(scores.get(item_text, 0.0)) for item_text in items}
+    exp_cache: dict[int, float] = {}
+    rows_by_item = store.get_evidence_for_items(group_id, user_id, item_type, items)
+    _fill_missing_trust(store, group_id, rows_by_item, trust_scores)
     for item_text in items:
-        evidence_rows = store.get_evidence_for_item(group_id, user_id, item_type, item_text)
+        evidence_rows = rows_by_item[item_text]
         if not evidence_rows:
             result[item_text] = 0.0
             continue
-        prod = 1.0
-        for row in evidence_rows:
-            evidence_conf = float(row.get("evidence_confidence") or 0.6)
-            joke_lik = float(row.get("joke_likelihood") or 0.2)
-            source_type = row.get("source_type") or "other"
-            source_weight = 1.0 if source_type == "self" else 0.7
-            speaker_id = str(row.get("speaker_id") or "")
-            trust = trust_scores.get(speaker_id)
-            if trust is None:
-                trust = store.get_user_trust(group_id, speaker_id) if speaker_id else 0.7
-            consistency_tag = row.get("consistency_tag")
-            consistency_weight = 1.0
-            if consistency_tag == "conflicting":
-                consistency_weight = 0.4
-            elif consistency_tag == "neutral":
-                consistency_weight = 0.7
-            signal = evidence_conf * (1 - joke_lik) * source_weight * trust * consistency_weight
-            if half_life_sec > 0:
-                delta = max(0.0, now - float(row.get("message_ts") or now))
-                decay = math.exp(-delta / half_life_sec)
-            else:
-                decay = 1.0
-            signal = _clamp(signal * decay)
-            prod *= 1 - signal
+        if half_life_sec > 0:
+            prod = _reduce_with_decay(
+                evidence_rows, trust_scores, now, half_life_sec, exp_cache
+            )
+        else:
+            prod = _reduce_no_decay(evidence_rows, trust_scores)
         result[item_text] = _clamp(1 - prod)
     return result
 
 
+def _fill_missing_trust(
+    store: ImpressionStore,
+    group_id: str,
+    rows_by_item: dict[str, list[EvidenceRow]],
+    trust_scores: dict[str, float],
+) -> None:
+    missing = {
+        row.speaker_id
+        for rows in rows_by_item.values()
+        for row in rows
+        if row.speaker_id not in trust_scores
+    }
+    if "" in missing:
+        missing.discard("")
+        trust_scores[""] = 0.7
+    if missing:
+        trust_scores.update(store.get_user_trusts(group_id, missing))
+
+
+def _evidence_signal(row: EvidenceRow, trust_scores: dict[str, float]) -> float:
+    return (
+        row.evidence_confidence
+        * (1 - row.joke_likelihood)
+        * _SOURCE_WEIGHT.get(row.source_type, 0.7)
+        * trust_scores[row.speaker_id]
+        * _CONSISTENCY_WEIGHT.get(row.consistency_tag, 1.0)
+    )
+
+
+def _reduce_no_decay(rows: list[EvidenceRow], trust_scores: dict[str, float]) -> float:
+    prod = 1.0
+    for row in rows:
+        prod *= 1 - _clamp(_evidence_signal(row, trust_scores))
+    return prod
+
+
+def _reduce_with_decay(
+    rows: list[EvidenceRow],
+    trust_scores: dict[str, float],
+    now: int,
+    half_life_sec: float,
+    exp_cache: dict[int, float],
+) -> float:
+    prod = 1.0
+    for row in rows:
+        delta = max(0, now - row.message_ts)
+        decay = exp_cache.get(delta)
+        if decay is None:
+            decay = exp_cache[delta] = math.exp(-delta / half_life_sec)
+        prod *= 1 - _clamp(_evidence_signal(row, trust_scores) * decay)
+    return prod
+
+
 def _should_run_phase3(
     final_by_user: dict[str, dict],
     profiles_by_user: dict[str, ProfileRecord | None],
     users_for_merge: set[str],
 ) -> bool:
-    if not users_for_merge:
-        return False
-    for user_id in users_for_merge:
-        items = final_by_user.get(user_id, {})
-        profile = profiles_by_user.get(user_id)
-        old_impressions = profile.impressions if profile else []
-        if sorted(old_impressions) != sorted(items.get("impressions", [])):
-            return True
-    return False
+    return any(
+        _user_needs_phase3(user_id, final_by_user, profiles_by_user)
+        for user_id in users_for_merge
+    )
+
+
+def _user_needs_phase3(
+    user_id: str,
+    final_by_user: dict[str, dict],
+    profiles_by_user: dict[str, ProfileRecord | None],
+) -> bool:
+    profile = profiles_by_user.get(user_id)
+    old_impressions = profile.impressions if profile else _EMPTY
+    new_impressions = final_by_user.get(user_id, _EMPTY_MAPPING).get("impressions", _EMPTY)
+    if len(old_impressions) != len(new_impressions):
+        return True
+    return Counter(old_impressions) != Counter(new_impressions)
+
+
+def _prompt_text(message: str, max_chars: int) -> str:
+    # Clipping happens only here, when a message is rendered into a prompt.
+    return message[:max_chars] if max_chars > 0 else message
 
 
 def build_group_attribution_prompt(
     pending,
     recent_profiles: list[ProfileRecord],
     include_summary: bool,
+    max_message_chars: int = 0,
 ) -> str:
-    lines = [
-        "Known user ids:",
-    ]
-    lines.append(", ".join([p.user_id for p in recent_profiles]))
-    lines.extend(["", "Known users (id -> nickname):"])
+    # One pass collects the id list and the nickname section together.
+    user_ids: list[str] = []
+    user_lines: list[str] = []
     for profile in recent_profiles:
+        user_ids.append(profile.user_id)
         if not profile.nickname:
             continue
-        lines.append(f"{profile.user_id}: {profile.nickname}")
+        user_lines.append(f"{profile.user_id}: {profile.nickname}")
         if include_summary and profile.summary:
-            summary = profile.summary.replace("\n", " ").strip()
+            summary = profile.summary.translate(_NL_TRANS).strip()
             if len(summary) > 80:
-                summary = summary[:80] + "..."
-            lines.append(f"summary: {summary}")
+                summary = f"{summary[:80]}..."
+            user_lines.append(f"summary: {summary}")
+    lines = [
+        f"Known user ids:\n{', '.join(user_ids)}\n\n"
+        "Known users (id -> nickname):",
+        *user_lines,
+    ]
     lines.extend(["", "Messages:"])
-    for msg in pending:
-        ts_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(msg.ts))
-        lines.append(
-            f"{msg.id}. [{ts_text}] speaker_id={msg.user_id} text={msg.message}"
-        )
+    if len(pending) > STRINGIO_MIN_MESSAGES:
+        buf = io.StringIO()
+        buf.write("\n".join(lines))
+        for msg in pending:
+            text = _prompt_text(msg.message, max_message_chars)
+            buf.write(f"\n{msg.id}. [{format_ts(msg.ts)}] speaker_id={msg.user_id} text={text}")
+        return buf.getvalue().strip()
+    lines.extend(
+        [
+            f"{msg.id}. [{format_ts(msg.ts)}] speaker_id={msg.user_id} "
+            f"text={_prompt_text(msg.message, max_message_chars)}"
+            for msg in pending
+        ]
+    )
     return "\n".join(lines).strip()
 
 
 def build_phase1_prompt(
     pending_by_user: dict[str, list],
-    known_user_ids: set[str],
+    sorted_user_ids: list[str],
     nickname_by_user: dict[str, str],
+    max_message_chars: int = 0,
+    message_total: int | None = None,
 ) -> str:
-    lines = [
-        "Known user ids:",
-        ", ".join(sorted(known_user_ids)),
-    ]
+    stream = build_phase1_prompt_stream(
+        pending_by_user, sorted_user_ids, nickname_by_user, max_message_chars
+    )
+    if message_total is None:
+        message_total = sum(map(len, pending_by_user.values()))
+    if message_total <= STRINGIO_MIN_MESSAGES:
+        return "\n".join(stream).strip()
+    # Large batches: write straight into one buffer instead of collecting
+    # every line into a list for join().
+    buf = io.StringIO()
+    write = buf.write
+    write(next(stream))
+    for line in stream:
+        write("\n")
+        write(line)
+    return buf.getvalue().strip()
+
+
+def build_phase1_prompt_stream(
+    pending_by_user: dict[str, list],
+    sorted_user_ids: list[str],
+    nickname_by_user: dict[str, str],
+    max_message_chars: int = 0,
+) -> Iterator[str]:
+    yield "Known user ids:"
+    yield ", ".join(sorted_user_ids)
     if nickname_by_user:
-        lines.extend(["", "Known users (id -> nickname):"])
-        for user_id in sorted(known_user_ids):
+        yield ""
+        yield "Known users (id -> nickname):"
+        for user_id in sorted_user_ids:
             nickname = nickname_by_user.get(user_id, "")
             if nickname:
-                lines.append(f"{user_id}: {nickname}")
-    lines.extend(["", "Messages (grouped by target_id):"])
+                yield f"{user_id}: {nickname}"
+    yield ""
+    yield "Messages (grouped by target_id):"
+    # A message attributed to several targets is rendered once and reused.
+    line_by_msg: dict[int, str] = {}
+    last_ts = None
+    ts_text = ""
     for user_id, messages in pending_by_user.items():
-        lines.append(f"target_id={user_id}")
+        yield f"target_id={user_id}"
         for msg in messages:
-            ts_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(msg.ts))
-            lines.append(
-                f"{msg.id}. [{ts_text}] speaker={msg.user_id} text={msg.message}"
-            )
-        lines.append("")
-    return "\n".join(lines).strip()
+            line = line_by_msg.get(msg.id)
+            if line is None:
+                if msg.ts != last_ts:
+                    last_ts = msg.ts
+                    ts_text = format_ts(msg.ts)
+                text = _prompt_text(msg.message, max_message_chars)
+                line = line_by_msg[msg.id] = (
+                    f"{msg.id}. [{ts_text}] speaker={msg.user_id} text={text}"
+                )
+            yield line
+        yield ""
 
 
 def build_phase2_prompt(
     existing_by_user: dict[str, dict],
     candidates_by_user: dict[str, dict],
 ) -> str:
-    lines = [
-        "Existing impressions (JSON by user_id):",
-        json_dumps(existing_by_user),
-        "",
-        "Candidate impressions (JSON by user_id):",
-        json_dumps(
-            {
-                user_id: {
-                    "impressions": list(payload.get("impressions", {}).keys()),
-                }
-                for user_id, payload in candidates_by_user.items()
-            }
-        ),
-    ]
-    return "\n".join(lines).strip()
+    # Existing impressions can be large; stream both payloads into one buffer
+    # instead of concatenating fully serialized copies.
+    buf = io.StringIO()
+    buf.write("Existing impressions (JSON by user_id):\n")
+    write_json(buf, existing_by_user)
+    buf.write("\n\nCandidate impressions (JSON by user_id):\n")
+    write_json(
+        buf,
+        {
+            user_id: {"impressions": list(payload.get("impressions", _EMPTY))}
+            for user_id, payload in candidates_by_user.items()
+        },
+    )
+    return buf.getvalue()
 
 
 def build_phase3_prompt(
     final_by_user: dict[str, dict],
-    profiles_by_user: dict[str, ProfileRecord | None],
+    summary_by_user: dict[str, str],
 ) -> str:
-    payload = {}
-    for user_id, items in final_by_user.items():
-        profile = profiles_by_user.get(user_id)
-        payload[user_id] = {
-            "summary": profile.summary if profile and profile.summary else "",
-            "impressions": items.get("impressions", []),
+    payload = {
+        user_id: {
+            "summary": summary_by_user.get(user_id, ""),
+            "impressions": final_by_user[user_id]["impressions"],
         }
-    lines = [
-        "Final impressions with existing summaries (JSON by user_id):",
-        json_dumps(payload),
-    ]
-    return "\n".join(lines).strip()
-
-
-def json_dumps(data: dict) -> str:
-    import json
-
-    return json.dumps(data, ensure_ascii=False)
+        for user_id in sorted(final_by_user)
+    }
+    return (
+        f"Final impressions with existing summaries (JSON by user_id):\n{dumps_json(payload)}"
+    ).strip()
@@ -1,19 +1,44 @@
 from __future__ import annotations
 
+import io
 import json
 import re
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
 
 from astrbot.core.message.components import At, Plain, Reply
 
+# Compiled once; these run per message on the update path.
+_TARGET_ID_RE = re.compile(r"@(\d+)|\[reply_to:(\d+)\]")
+_TARGET_MARKER_RE = re.compile(r"\[reply_to:\d+\]|@\d+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[\w\u4e00-\u9fff]+")
+_ALIAS_TOKEN_RE = re.compile(r"[\w\u4e00-\u9fff]{2,16}")
+_JSON_SCAN_RE = re.compile(r'[{}"\\]')
+# json.dumps builds a fresh encoder per call with non-default options. Compact
+# separators match orjson, so output is identical with or without it.
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_SELF_PROFILE_RES = (
+    re.compile(r"(我|本人|自己).{0,6}(印象|记得|回忆|了解|评价|认识|是谁|什么样|资料|档案)"),
+    re.compile(r"(印象|记得|回忆|了解|评价|认识).{0,6}(我|本人|自己)"),
+)
+
 
 def extract_plain_text(components) -> str:
-    parts: list[str] = []
-    for comp in components:
-        if isinstance(comp, Plain):
-            text = comp.text.strip()
-            if text:
-                parts.append(text)
-    return " ".join(parts).strip()
+    # Pieces are already stripped and non-empty, so the joined text needs no
+    # outer strip. A list (not a generator) is what join consumes fastest.
+    return " ".join(
+        [
+            text
+            for comp in components
+            if isinstance(comp, Plain) and (text := comp.text.strip())
+        ]
+    )
 
 
 def extract_raw_text(components) -> str:
@@ -27,13 +52,42 @@ def extract_raw_text(components) -> str:
             parts.append(f"@{comp.qq}")
         elif isinstance(comp, Reply) and comp.sender_id is not None:
             parts.append(f"[reply_to:{comp.sender_id}]")
-    return " ".join(parts).strip()
+    return " ".join(parts)
 
 
 def safe_list(value, fallback: list[str]) -> list[str]:
-    if isinstance(value, list) and value:
-        return [str(x) for x in value]
-    return fallback
+    if not isinstance(value, list) or not value:
+        return fallback
+    # Parsed LLM output is usually all strings already; hand that list back
+    # as-is instead of copying it.
+    if all(type(x) is str for x in value):
+        return value
+    return [str(x) for x in value]
+
+
+def dumps_json(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return _JSON_ENCODER.encode(value)
+
+
+def write_json(buf: io.StringIO, value) -> None:
+    if orjson is not None:
+        buf.write(orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8"))
+        return
+    for chunk in _JSON_ENCODER.iterencode(value):
+        buf.write(chunk)
+
+
+def loads_json(raw: str):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (NaN, ints past 64 bits); let the stdlib parser
+            # make the final call so accepted inputs do not change.
+            pass
+    return json.loads(raw)
 
 
 def extract_json(text: str) -> str:
@@ -44,95 +98,155 @@ def extract_json(text: str) -> str:
     return text[start : end + 1]
 
 
+def extract_first_json_object(text: str) -> str:
+    # Slice of the first balanced top-level object. Only structural characters
+    # are visited; the regex engine skips over everything else.
+    start = text.find("{")
+    if start == -1:
+        return ""
+    depth = 0
+    in_string = False
+    escaped_pos = -1
+    for match in _JSON_SCAN_RE.finditer(text, start):
+        pos = match.start()
+        if pos == escaped_pos:
+            continue
+        char = match.group()
+        if in_string:
+            if char == "\\":
+                escaped_pos = pos + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : pos + 1]
+    return ""
+
+
+def load_json_payload(text: str):
+    # The first-to-last brace slice is two C-level scans and is right for a
+    # response that is one object. Only when it does not parse (prose or a
+    # second snippet around the JSON) is the balanced scan worth paying for.
+    raw = extract_json(text)
+    if not raw:
+        return None
+    try:
+        return loads_json(raw)
+    except json.JSONDecodeError:
+        pass
+    first = extract_first_json_object(raw)
+    if not first or first == raw:
+        return None
+    try:
+        return loads_json(first)
+    except json.JSONDecodeError:
+        return None
+
+
+def collapse_whitespace(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text.strip())
+
+
 def plain_from_raw_text(text: str) -> str:
     if not text:
         return ""
-    cleaned = re.sub(r"\[reply_to:\d+\]", " ", text)
-    cleaned = re.sub(r"@\d+", " ", cleaned)
-    cleaned = re.sub(r"\s+", " ", cleaned)
-    return cleaned.strip()
+    if "@" not in text and "[reply_to:" not in text:
+        # Plain chat text: only the whitespace normalisation applies.
+        return " ".join(text.split())
+    cleaned = _TARGET_MARKER_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", cleaned).strip()
 
 
+@lru_cache(maxsize=4096)
+def format_ts(ts: int) -> str:
+    dt = datetime.fromtimestamp(ts)
+    return (
+        f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} "
+        f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+    )
 
 
 def extract_target_ids_from_raw_text(text: str) -> set[str]:
-    if not text:
+    if not text or ("@" not in text and "[reply_to:" not in text):
         return set()
-    targets = set(re.findall(r"@(\d+)", text))
-    targets.update(re.findall(r"\[reply_to:(\d+)\]", text))
-    return {t for t in targets if t}
+    # One scan for both marker kinds; exactly one group matches per hit.
+    return {at or reply for at, reply in _TARGET_ID_RE.findall(text)}
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD_RE.findall(text)
+
 
+def alias_tokens(text: str) -> list[str]:
+    return _ALIAS_TOKEN_RE.findall(text) if text else []
 
-def last_token(text: str) -> str:
-    tokens = re.findall(r"[\w\u4e00-\u9fff]+", text)
+
+def last_of_tokens(tokens: list[str]) -> str:
     if not tokens:
         return ""
     token = tokens[-1].strip()
     return token if len(token) >= 2 else ""
 
 
-def token_count(text: str) -> int:
-    return len(re.findall(r"[\w\u4e00-\u9fff]+", text))
+_IMPRESSION_QUERY_WORDS = (
+    "印象",
+    "记得",
+    "回忆",
+    "回想",
+    "了解",
+    "认识",
+    "讲讲",
+    "说说",
+    "聊聊",
+    "介绍",
+    "说一下",
+    "评价",
+    "看法",
+    "印记",
+    "档案",
+    "资料",
+    "卡片",
+    "人物",
+    "身份",
+    "角色",
+    "关系",
+    "背景",
+    "喜欢",
+    "爱吃",
+    "偏好",
+    "兴趣",
+    "性格",
+    "特征",
+    "是谁",
+    "谁是",
+    "有谁",
+    "什么样",
+    "种族",
+)
+# One alternation scan instead of a substring search per keyword.
+_IMPRESSION_QUERY_RE = re.compile("|".join(map(re.escape, _IMPRESSION_QUERY_WORDS)))
 
 
 def is_impression_query(text: str) -> bool:
     if not text:
         return False
-    patterns = [
-        "印象",
-        "记得",
-        "回忆",
-        "回想",
-        "了解",
-        "认识",
-        "讲讲",
-        "说说",
-        "聊聊",
-        "介绍",
-        "说一下",
-        "评价",
-        "看法",
-        "印记",
-        "档案",
-        "资料",
-        "卡片",
-        "人物",
-        "身份",
-        "角色",
-        "关系",
-        "背景",
-        "喜欢",
-        "爱吃",
-        "偏好",
-        "兴趣",
-        "性格",
-        "特征",
-        "是谁",
-        "谁是",
-        "有谁",
-        "什么样",
-        "种族"
-    ]
-    return any(p in text for p in patterns)
+    return _IMPRESSION_QUERY_RE.search(text) is not None
 
 
 def is_self_profile_query(text: str) -> bool:
     if not text:
         return False
-    patterns = [
-        r"(我|本人|自己).{0,6}(印象|记得|回忆|了解|评价|认识|是谁|什么样|资料|档案)",
-        r"(印象|记得|回忆|了解|评价|认识).{0,6}(我|本人|自己)",
-    ]
-    return any(re.search(p, text) for p in patterns)
+    return any(p.search(text) for p in _SELF_PROFILE_RES)
 
 
 def parse_profile_json(text: str, existing: dict) -> tuple[dict, bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
 
     summary = str(data.get("summary", "")).strip() or existing.get("summary", "")
@@ -152,45 +266,43 @@ def parse_profile_json(text: str, existing: dict) -> tuple[dict, bool]:
 def parse_group_profile_json(
     text: str, existing_by_user: dict[str, dict]
 ) -> tuple[dict[str, dict], bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
 
     users = data.get("users") if isinstance(data, dict) else None
     if users is None:
         users = data
 
+    # Unknown users and non-object payloads are dropped while collecting, so
+    # nothing is materialized only to be filtered out again.
     if isinstance(users, list):
         items = []
         for item in users:
             if not isinstance(item, dict):
                 continue
             user_id = str(item.get("user_id") or item.get("id") or "").strip()
-            if not user_id:
-                continue
-            items.append((user_id, item))
+            if user_id in existing_by_user:
+                items.append((user_id, item))
     elif isinstance(users, dict):
-        items = [(str(k).strip(), v) for k, v in users.items()]
+        items = [
+            (user_id, payload)
+            for key, payload in users.items()
+            if isinstance(payload, dict)
+            and (user_id := str(key).strip()) in existing_by_user
+        ]
     else:
         return {}, False
 
     results: dict[str, dict] = {}
     for user_id, payload in items:
-        if not user_id or user_id not in existing_by_user:
-            continue
-        if not isinstance(payload, dict):
-            continue
         existing = existing_by_user[user_id]
-        summary = str(payload.get("summary", "")).strip() or existing.get("summary", "")
-        impressions = payload.get("impressions")
+        payload_get = payload.get
+        summary = str(payload_get("summary", "")).strip() or existing.get("summary", "")
         results[user_id] = {
             "summary": summary,
             "impressions": safe_list(
-                impressions, existing.get("impressions", [])
+                payload_get("impressions"), existing.get("impressions", [])
             ),
         }
 
@@ -202,12 +314,8 @@ def parse_group_profile_json(
 def parse_phase1_candidates(
     text: str, known_user_ids: set[str]
 ) -> tuple[dict[str, dict[str, list[dict]]], bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
     users = data.get("users") if isinstance(data, dict) else None
     if not isinstance(users, dict):
@@ -232,12 +340,8 @@ def parse_phase1_candidates(
 def parse_phase2_merge(
     text: str, known_user_ids: set[str]
 ) -> tuple[dict[str, dict], bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
     users = data.get("users") if isinstance(data, dict) else None
     if not isinstance(users, dict):
@@ -270,12 +374,8 @@ def parse_phase2_merge(
 def parse_phase3_summaries(
     text: str, known_user_ids: set[str]
 ) -> tuple[dict[str, str], bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
     users = data.get("users") if isinstance(data, dict) else None
     if not isinstance(users, dict):
@@ -294,12 +394,8 @@ def parse_phase3_summaries(
 
 
 def parse_attribution_json(text: str, known_user_ids: set[str]) -> tuple[dict[int, list[str]], bool]:
-    raw = extract_json(text)
-    if not raw:
-        return {}, False
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+    data = load_json_payload(text)
+    if data is None:
         return {}, False
 
     assignments = data.get("assignments") if isinstance(data, dict) else None
@@ -318,7 +414,13 @@ def parse_attribution_json(text: str, known_user_ids: set[str]) -> tuple[dict[in
         target_ids = item.get("target_ids")
         if not isinstance(target_ids, list):
             continue
-        filtered = [str(t).strip() for t in target_ids if str(t).strip() in known_user_ids]
+        # Keep the model's order (it decides bucketing order downstream), so
+        # filter with a single strip per id rather than a set intersection.
+        filtered = [
+            target_id
+            for t in target_ids
+            if (target_id := str(t).strip()) in known_user_ids
+        ]
         if filtered:
             results[message_id_int] = filtered
 